@@ -1,16 +1,30 @@
 import os
 import sys
-import shutil
+import atexit
 import tkinter as tk
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, filedialog, messagebox
-from PIL import Image
 
 from viewport import ImageViewport
-from config import AppConfig, HISTORY_FILE, GLOBAL_WORDS_FILE
-from suggestions import SuggestionStore, parts_from_text, SUGGEST_THRESHOLD
+from config import AppConfig, HISTORY_FILE, GLOBAL_WORDS_FILE, TRIAGE_CACHE_FILE
+from suggestions import SuggestionStore, parts_from_text, SUGGEST_THRESHOLD, DISPLAY_LIMIT
+from triage import TriageCache, TriageRunner, is_low_res, is_blurry
+from export import export_frame, profile_ext, record_stats, stats_summary
+from fsutil import NameIndexRegistry, move_unique
+from metaindex import export_metadata, mark_deleted
+from shards import ShardWriter
+from leases import LeaseManager, LEASE_TTL
+from state import StateStore
+from recaption import CaptionRules, recaption_dirs
+from frames import expand_paths, open_item, SUPPORTED_EXTS
+from stages import STAGES, STAGE_LABELS, report_summary
+from imagecache import DecodedImageCache
 from pathlib import Path
 
-SUPPORTED_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp"}
+SORT_MODES = ("Queue order", "Resolution (low first)", "Sharpness (low first)")
+EXPORT_POLL_MS = 30     # how often the Tk thread checks the export worker for finished saves
+CLAIM_RETRY_MS = 5000  # shared folder: how often to retry when everything left is claimed elsewhere
 
 class LoraPrepareApp(tk.Tk):
     def __init__(self):
@@ -37,13 +51,64 @@ class LoraPrepareApp(tk.Tk):
             self.geometry("1400x1000")
         self.minsize(1150, 920)
 
-        # State
+        # State (queue of frames.QueueItem; multi-frame files expand to one item per frame)
         self.images = []
         self.idx = -1
         self.frame_size_var = tk.IntVar(value=int(self.config.get("frame_size", 768)))
 
         # Suggestions store
-        self.suggest = SuggestionStore(self.history_path)
+        self.suggest = SuggestionStore(
+            self.history_path,
+            capacity=self.config.get("suggest_capacity", 2000),
+            decay_every=self.config.get("suggest_decay_every", 200),
+            decay_factor=self.config.get("suggest_decay_factor", 0.9),
+        )
+
+        # Debounced, atomic persistence for config / history / global words
+        self.state = StateStore(self)
+        self.state.register("config", self.config.path, self.config.dumps)
+        self.state.register("history", self.history_path, self.suggest.dumps)
+        self.state.mark_dirty("history")  # keep the history file alphabetical on disk
+
+        # File names in each resolved output/processed dir (scanned once, updated on every write)
+        self.names = NameIndexRegistry()
+
+        # Optional tar shard sink (one writer per resolved shard dir); partial shards are closed on exit
+        self.shard_writers = {}
+        self.shard_export_var = tk.BooleanVar(value=bool(self.config.get("shard_export", False)))
+        atexit.register(self._close_shards)
+
+        # Shared-folder mode: one LeaseManager per resolved coordination dir
+        self.leases = {}
+        self._claim_retry = None  # after() id while waiting for other operators' claims
+        self.shared_queue_var = tk.BooleanVar(value=bool(self.config.get("shared_queue", False)))
+
+        # Queue triage (header dimensions + blur score, computed in the background)
+        self.triage_cache = TriageCache(os.path.join(self.app_dir, TRIAGE_CACHE_FILE))
+        self.triage = TriageRunner(self.triage_cache)
+        self._triage_poll = None  # after() id of the running poll chain
+        self.sort_mode_var = tk.StringVar(value=SORT_MODES[0])
+        self.flag_lowres_var = tk.BooleanVar(value=True)
+        self.flag_blurry_var = tk.BooleanVar(value=True)
+
+        # Decoded pixels of recently shown images, so Previous does not pay the decode again
+        self.decoded_cache = None
+        cache_mb = float(self.config.get("decoded_cache_mb", 2048) or 0)
+        if cache_mb > 0:
+            cache_dir = os.path.join(self.app_dir, self.config.get("decoded_cache_dir") or "decoded_cache")
+            try:
+                self.decoded_cache = DecodedImageCache(cache_dir, int(cache_mb * 1024 * 1024))
+            except OSError:
+                pass
+        # Saves run stages + encode + writes on one worker thread, so the UI moves on to the next image;
+        # finished saves are picked up in order on the Tk thread, which does the file bookkeeping
+        self.export_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+        self._exports = deque()   # (future, save context) in submission order
+        self._export_poll = None  # after() id while saves are in flight
+        # (path, frame) -> last export of that queue entry: output files, notes and crop transform
+        self.exported = {}
+        # current path of a moved original -> path it was queued from (output/processed dirs resolve from that)
+        self.origins = {}
 
         # --- Layout: 67/33 split
         self.panes = tk.PanedWindow(self, orient="horizontal", sashrelief="flat", sashwidth=6)
@@ -60,7 +125,8 @@ class LoraPrepareApp(tk.Tk):
         self.viewport = ImageViewport(
             self.left_wrap,
             self.get_frame_size,
-            no_image_click_callback=self.choose_files
+            no_image_click_callback=self.choose_files,
+            bake_dim=bool(self.config.get("viewport_bake_dim", True)),
         )
         self.viewport.grid(row=0, column=0, sticky="nsew", padx=(14, 10), pady=(14, 8))
 
@@ -83,43 +149,75 @@ class LoraPrepareApp(tk.Tk):
         size_menu.grid(row=1, column=0, sticky="ew", pady=(0, 8))
 
         ttk.Button(side, text="Open Images…", command=self.choose_files).grid(row=2, column=0, sticky="ew")
+        ttk.Checkbutton(side, text="Shared folder (claim images so other operators skip them)",
+                        variable=self.shared_queue_var, command=self._on_shared_queue_changed
+                        ).grid(row=3, column=0, sticky="w", pady=(4, 0))
         self.file_label = ttk.Label(side, text="No files loaded", wraplength=320)
-        self.file_label.grid(row=3, column=0, sticky="w", pady=(6, 10))
+        self.file_label.grid(row=4, column=0, sticky="w", pady=(6, 10))
 
         # Export dirs (prefilled with effective defaults; no extra labels)
-        ttk.Separator(side, orient="horizontal").grid(row=4, column=0, sticky="ew", pady=(6, 8))
-        ttk.Label(side, text="Export folders").grid(row=5, column=0, sticky="w")
+        ttk.Separator(side, orient="horizontal").grid(row=5, column=0, sticky="ew", pady=(6, 8))
+        ttk.Label(side, text="Export folders").grid(row=6, column=0, sticky="w")
 
-        out_row = ttk.Frame(side); out_row.grid(row=6, column=0, sticky="ew", pady=(2, 2))
+        out_row = ttk.Frame(side); out_row.grid(row=7, column=0, sticky="ew", pady=(2, 2))
         out_row.columnconfigure(0, weight=1)
         self.output_dir_var = tk.StringVar(value=self.config.get("output_dir"))
         out_entry = ttk.Entry(out_row, textvariable=self.output_dir_var); out_entry.grid(row=0, column=0, sticky="ew")
         ttk.Button(out_row, text="Browse…", command=self._browse_output_dir).grid(row=0, column=1, padx=(6, 0))
 
-        proc_row = ttk.Frame(side); proc_row.grid(row=7, column=0, sticky="ew", pady=(2, 8))
+        proc_row = ttk.Frame(side); proc_row.grid(row=8, column=0, sticky="ew", pady=(2, 8))
         proc_row.columnconfigure(0, weight=1)
         self.processed_dir_var = tk.StringVar(value=self.config.get("processed_dir"))
         proc_entry = ttk.Entry(proc_row, textvariable=self.processed_dir_var); proc_entry.grid(row=0, column=0, sticky="ew")
         ttk.Button(proc_row, text="Browse…", command=self._browse_processed_dir).grid(row=0, column=1, padx=(6, 0))
 
-        ttk.Button(side, text="Fit full", command=self.viewport.fit_full).grid(row=8, column=0, sticky="ew")
-        ttk.Button(side, text="Cover frame", command=self.viewport.fit_cover_frame).grid(row=9, column=0, sticky="ew")
+        # Export profile (encoder settings from config.json) + measured cost
+        profile_row = ttk.Frame(side); profile_row.grid(row=9, column=0, sticky="ew", pady=(0, 8))
+        profile_row.columnconfigure(0, weight=1)
+        self.export_profile_var = tk.StringVar(value=self.config.get("export_profile"))
+        ttk.OptionMenu(
+            profile_row, self.export_profile_var, self.export_profile_var.get(),
+            *self.config.get("export_profiles").keys(), command=self._on_export_profile_changed
+        ).grid(row=0, column=0, sticky="ew")
+        self.export_stats_label = ttk.Label(profile_row, text="", foreground="#666")
+        self.export_stats_label.grid(row=1, column=0, sticky="w", pady=(2, 0))
+        self._update_export_stats_label()
+        ttk.Checkbutton(profile_row, text="Also write tar shards", variable=self.shard_export_var,
+                        command=self._on_shard_export_changed).grid(row=2, column=0, sticky="w", pady=(2, 0))
+
+        # Post-crop processing stages (run on the cropped frame before encoding)
+        stages_row = ttk.Frame(profile_row); stages_row.grid(row=3, column=0, sticky="ew", pady=(2, 0))
+        enabled = set(self.config.get("process_stages") or [])
+        self.stage_vars = {}
+        for i, name in enumerate(STAGES):
+            var = tk.BooleanVar(value=name in enabled)
+            self.stage_vars[name] = var
+            r, c = divmod(i, 2)
+            ttk.Checkbutton(stages_row, text=STAGE_LABELS[name], variable=var,
+                            command=self._on_stages_changed).grid(row=r, column=c, sticky="w", padx=(0, 8))
+        self.stage_report_label = ttk.Label(profile_row, text="", foreground="#666", wraplength=320)
+        self.stage_report_label.grid(row=4, column=0, sticky="w")
+
+        ttk.Button(side, text="Fit full", command=self.viewport.fit_full).grid(row=10, column=0, sticky="ew")
+        ttk.Button(side, text="Cover frame", command=self.viewport.fit_cover_frame).grid(row=11, column=0, sticky="ew")
 
         # Global words
-        ttk.Separator(side, orient="horizontal").grid(row=10, column=0, sticky="ew", pady=8)
-        ttk.Label(side, text="Global words (prefixed to each .txt)").grid(row=11, column=0, sticky="w")
-        global_wrap = ttk.Frame(side); global_wrap.grid(row=12, column=0, sticky="ew")
+        ttk.Separator(side, orient="horizontal").grid(row=12, column=0, sticky="ew", pady=8)
+        ttk.Label(side, text="Global words (prefixed to each .txt)").grid(row=13, column=0, sticky="w")
+        global_wrap = ttk.Frame(side); global_wrap.grid(row=14, column=0, sticky="ew")
         self.global_text = tk.Text(global_wrap, height=3, wrap="word")
         self.global_text.pack(side="left", fill="x", expand=True)
         gscroll = ttk.Scrollbar(global_wrap, orient="vertical", command=self.global_text.yview)
         gscroll.pack(side="right", fill="y")
         self.global_text.configure(yscrollcommand=gscroll.set)
+        ttk.Button(side, text="Apply global words to existing outputs…",
+                   command=self.recaption_outputs).grid(row=15, column=0, sticky="ew", pady=(4, 0))
 
         # Notes
-        ttk.Separator(side, orient="horizontal").grid(row=13, column=0, sticky="ew", pady=8)
-        ttk.Label(side, text="Notes per image (saved as .txt)").grid(row=14, column=0, sticky="w")
-        notes_wrap = ttk.Frame(side); notes_wrap.grid(row=15, column=0, sticky="nsew")
-        side.rowconfigure(15, weight=1)
+        ttk.Separator(side, orient="horizontal").grid(row=16, column=0, sticky="ew", pady=8)
+        ttk.Label(side, text="Notes per image (saved as .txt)").grid(row=17, column=0, sticky="w")
+        notes_wrap = ttk.Frame(side); notes_wrap.grid(row=18, column=0, sticky="nsew")
+        side.rowconfigure(18, weight=1)
         self.note_text = tk.Text(notes_wrap, height=6, wrap="word")
         self.note_text.pack(side="left", fill="both", expand=True)
         nscroll = ttk.Scrollbar(notes_wrap, orient="vertical", command=self.note_text.yview)
@@ -127,18 +225,46 @@ class LoraPrepareApp(tk.Tk):
         self.note_text.configure(yscrollcommand=nscroll.set)
 
         # Suggestions
-        self.suggest_wrap = ttk.Frame(side); self.suggest_wrap.grid(row=16, column=0, sticky="ew", pady=(6, 0))
+        self.suggest_wrap = ttk.Frame(side); self.suggest_wrap.grid(row=19, column=0, sticky="ew", pady=(6, 0))
         header = ttk.Frame(self.suggest_wrap); header.pack(fill="x")
         self.suggest_caption = ttk.Label(header, text="", foreground="#666"); self.suggest_caption.pack(side="left", anchor="w")
         ttk.Button(header, text="Clear history", command=self.clear_history).pack(side="right")
         self.suggest_items_frame = ttk.Frame(self.suggest_wrap); self.suggest_items_frame.pack(fill="x", expand=True)
 
-        ttk.Separator(side, orient="horizontal").grid(row=17, column=0, sticky="ew", pady=8)
-        ttk.Button(side, text="Save & Next", command=self.save_and_next).grid(row=18, column=0, sticky="ew")
-        ttk.Button(side, text="Skip", command=self.skip).grid(row=19, column=0, sticky="ew", pady=(4, 0))
+        ttk.Separator(side, orient="horizontal").grid(row=20, column=0, sticky="ew", pady=8)
+        ttk.Button(side, text="Save & Next", command=self.save_and_next).grid(row=21, column=0, sticky="ew")
+        nav_row = ttk.Frame(side); nav_row.grid(row=22, column=0, sticky="ew", pady=(4, 0))
+        nav_row.columnconfigure(0, weight=1); nav_row.columnconfigure(1, weight=1)
+        ttk.Button(nav_row, text="Previous", command=self.previous_image).grid(row=0, column=0, sticky="ew")
+        ttk.Button(nav_row, text="Skip", command=self.skip).grid(row=0, column=1, sticky="ew", padx=(6, 0))
 
         self.progress_label = ttk.Label(side, text="—")
-        self.progress_label.grid(row=20, column=0, sticky="w", pady=(8, 0))
+        self.progress_label.grid(row=23, column=0, sticky="w", pady=(8, 0))
+
+        # Queue triage
+        ttk.Separator(side, orient="horizontal").grid(row=24, column=0, sticky="ew", pady=8)
+        sort_row = ttk.Frame(side); sort_row.grid(row=25, column=0, sticky="ew")
+        sort_row.columnconfigure(1, weight=1)
+        ttk.Label(sort_row, text="Sort queue").grid(row=0, column=0, sticky="w", padx=(0, 6))
+        ttk.OptionMenu(
+            sort_row, self.sort_mode_var, self.sort_mode_var.get(), *SORT_MODES,
+            command=lambda _v: self._sort_queue()
+        ).grid(row=0, column=1, sticky="ew")
+
+        flag_row = ttk.Frame(side); flag_row.grid(row=26, column=0, sticky="ew", pady=(4, 0))
+        ttk.Label(flag_row, text="Flag").pack(side="left", padx=(0, 6))
+        ttk.Checkbutton(flag_row, text="Below frame size", variable=self.flag_lowres_var,
+                        command=self._update_triage_label).pack(side="left")
+        ttk.Checkbutton(flag_row, text="Blurry", variable=self.flag_blurry_var,
+                        command=self._update_triage_label).pack(side="left", padx=(6, 0))
+
+        bulk_row = ttk.Frame(side); bulk_row.grid(row=27, column=0, sticky="ew", pady=(4, 0))
+        bulk_row.columnconfigure(0, weight=1); bulk_row.columnconfigure(1, weight=1)
+        ttk.Button(bulk_row, text="Hide flagged", command=self.hide_flagged).grid(row=0, column=0, sticky="ew")
+        ttk.Button(bulk_row, text="Skip flagged", command=self.skip_flagged).grid(row=0, column=1, sticky="ew", padx=(6, 0))
+
+        self.triage_label = ttk.Label(side, text="", foreground="#666")
+        self.triage_label.grid(row=28, column=0, sticky="w", pady=(4, 0))
 
         # Init data
         self._load_global_words()
@@ -153,9 +279,11 @@ class LoraPrepareApp(tk.Tk):
         self.bind_all("<Control-plus>", lambda e: self.viewport.zoom_in(fine=True))
         self.bind_all("<Control-minus>", lambda e: self.viewport.zoom_out(fine=True))
         self.bind_all("<Control-Right>", self._ctrl_right_guard)
+        self.bind_all("<Control-Left>", self._ctrl_left_guard)
         self.bind_all("<Return>", self._enter_open_if_empty)
 
         self.protocol("WM_DELETE_WINDOW", self.on_close)
+        self._schedule_lease_renewal()
 
         if not self.images:
             self.viewport.clear()
@@ -169,15 +297,114 @@ class LoraPrepareApp(tk.Tk):
         return self.frame_size_var.get()
 
     def _on_frame_size_changed(self, _value=None):
-        self.viewport._draw_overlay()
+        self.viewport._redraw()
         self.config.set("frame_size", int(self.frame_size_var.get()))
         self._save_config()
+        self._update_triage_label()
+
+    def _on_export_profile_changed(self, _value=None):
+        self.config.set("export_profile", self.export_profile_var.get())
+        self._save_config()
+        self._update_export_stats_label()
+
+    def _update_export_stats_label(self):
+        name = self.export_profile_var.get()
+        self.export_stats_label.config(text=stats_summary(self.config.get("export_stats"), name))
+
+    def _on_stages_changed(self):
+        self.config.set("process_stages", [n for n, var in self.stage_vars.items() if var.get()])
+        self._save_config()
+
+    def _on_shard_export_changed(self):
+        self.config.set("shard_export", bool(self.shard_export_var.get()))
+        self._save_config()
+        if not self.shard_export_var.get():
+            self._close_shards()
+
+    def _origin(self, path):
+        """Where a queue entry's file was queued from; relative output/processed dirs resolve against it."""
+        return self.origins.get(path, path)
+
+    def _shard_writer_for(self, src_path):
+        shard_dir = self.config.effective_shard_dir_for(self._origin(src_path))
+        writer = self.shard_writers.get(shard_dir)
+        if writer is None:
+            max_bytes = int(float(self.config.get("shard_max_mb", 1024)) * 1024 * 1024)
+            writer = ShardWriter(shard_dir, max_bytes)
+            self.shard_writers[shard_dir] = writer
+        return writer
+
+    # ---- Shared folder leases ----
+    def _on_shared_queue_changed(self):
+        self.config.set("shared_queue", bool(self.shared_queue_var.get()))
+        self._save_config()
+        if self.shared_queue_var.get():
+            if self.images and 0 <= self.idx < len(self.images) and not self._claim(self.images[self.idx].path):
+                messagebox.showinfo("Shared folder", "This image is already claimed by another operator.")
+                self.load_current()
+                self.update_status()
+        else:
+            self._finish_exports()
+            self._release_leases()
+
+    def _leases_for(self, src_path):
+        coord_dir = self.config.effective_coord_dir_for(src_path)
+        mgr = self.leases.get(coord_dir)
+        if mgr is None:
+            mgr = LeaseManager(coord_dir, float(self.config.get("lease_ttl", LEASE_TTL)))
+            self.leases[coord_dir] = mgr
+        return mgr
+
+    def _claim(self, path):
+        """Release whatever we held before and claim path; False if another instance has it."""
+        # Entries still being saved keep their lease until the original has moved
+        keep = {path} | {ctx["key"][0] for _future, ctx in self._exports}
+        for mgr in self.leases.values():
+            mgr.release_all(keep=keep)
+        try:
+            return self._leases_for(path).try_claim(path)
+        except OSError:
+            return False
+
+    def _release_leases(self):
+        for mgr in self.leases.values():
+            mgr.release_all()
+
+    def _schedule_lease_renewal(self):
+        ttl = float(self.config.get("lease_ttl", LEASE_TTL))
+        self.after(max(1000, int(ttl * 1000 / 3)), self._renew_leases)
+
+    def _wait_for_claims(self):
+        """Every remaining image is claimed by another operator: show nothing and retry shortly."""
+        self.viewport.clear()
+        self.file_label.config(text="Waiting: the remaining images are claimed by other operators")
+        if self._claim_retry is None:
+            self._claim_retry = self.after(CLAIM_RETRY_MS, self._retry_claims)
+
+    def _retry_claims(self):
+        self._claim_retry = None
+        if self.images and 0 <= self.idx < len(self.images):
+            self.load_current()
+            self.update_status()
+
+    def _renew_leases(self):
+        for mgr in self.leases.values():
+            mgr.renew_all()
+        self._schedule_lease_renewal()
+
+    def _close_shards(self):
+        writers, self.shard_writers = self.shard_writers, {}
+        for writer in writers.values():
+            try:
+                writer.close()
+            except Exception as e:
+                print(f"[shards] failed to close shard in {writer.directory}: {e}", file=sys.stderr)
 
     def _save_config(self):
         self.config.set("geometry", self.geometry())
         self.config.set("output_dir", self.output_dir_var.get().strip())
         self.config.set("processed_dir", self.processed_dir_var.get().strip())
-        self.config.save()
+        self.state.mark_dirty("config")
 
     def _browse_output_dir(self):
         initial = self.output_dir_var.get().strip() or self.app_dir
@@ -206,6 +433,8 @@ class LoraPrepareApp(tk.Tk):
 
     # ---- File handling ----
     def choose_files(self):
+        if not self._finish_exports():
+            return
         init_dir = self.last_open_dir
         if not os.path.isdir(init_dir):
             init_dir = os.path.expanduser("~")
@@ -215,7 +444,7 @@ class LoraPrepareApp(tk.Tk):
             title="Select Images",
             initialdir=os.path.abspath(init_dir),
             filetypes=[
-                ("Image files", ("*.jpg", "*.jpeg", "*.png", "*.bmp", "*.tif", "*.tiff", "*.webp")),
+                ("Image files", ("*.jpg", "*.jpeg", "*.png", "*.bmp", "*.tif", "*.tiff", "*.webp", "*.gif")),
                 ("All files", "*.*"),
             ]
         )
@@ -229,30 +458,63 @@ class LoraPrepareApp(tk.Tk):
         self.config.set("last_open_dir", self.last_open_dir)
         self._save_config()
 
-        self.images = files
+        self.images = expand_paths(files)
+        self.origins = {}
         self.idx = 0
         self.clear_notes()
         self.load_current()
         self.update_status()
+        self._start_triage()
 
     def _enter_open_if_empty(self, event=None):
         if not self.images:
             self.choose_files()
             return "break"
 
-    def load_current(self):
+    def load_current(self, claim=True):
         if not self.images or self.idx < 0 or self.idx >= len(self.images):
             self.viewport.clear()
             self.file_label.config(text="No files loaded")
             return
-        path = self.images[self.idx]
+        if claim and self.shared_queue_var.get():
+            # Images another operator holds go to the back of the queue and are retried later (their
+            # lease may be released or expire); only ones whose original has left the input folder drop out
+            tried = 0
+            while self.idx < len(self.images) and tried < len(self.images) - self.idx:
+                path = self.images[self.idx].path
+                if self._claim(path):
+                    break
+                if os.path.exists(path):
+                    self.images.append(self.images.pop(self.idx))
+                    tried += 1
+                else:
+                    del self.images[self.idx]
+            if self.idx >= len(self.images):
+                self._queue_done()
+                return
+            if tried and tried >= len(self.images) - self.idx:
+                self._wait_for_claims()
+                return
+        item = self.images[self.idx]
+        cached = self.decoded_cache.get(item.path, item.frame) if self.decoded_cache else None
         try:
-            pil = Image.open(path)
+            pil = cached if cached is not None else open_item(item)
         except Exception:
             self.skip(move_current=False)
             return
         self.viewport.set_image(pil)
-        self.file_label.config(text=os.path.basename(path))
+        if cached is None and self.decoded_cache is not None:
+            self.decoded_cache.put(item.path, item.frame, pil)  # decoded by set_image
+        self.file_label.config(text=item.label())
+
+        # Revisiting an exported entry: bring back its notes and crop
+        prev = self.exported.get((item.path, item.frame))
+        if prev is not None:
+            self.note_text.delete("1.0", "end")
+            self.note_text.insert("1.0", prev["notes"])
+            S, dx, dy, frame = prev["transform"]
+            if frame == self.get_frame_size():
+                self.viewport.set_frame_transform(S, dx, dy)
 
     def update_status(self):
         self.progress_label.config(text="—" if not self.images else f"Image {self.idx + 1} of {len(self.images)}")
@@ -275,7 +537,7 @@ class LoraPrepareApp(tk.Tk):
         self.suggest_caption.configure(text="Frequently used (A–Z): click to insert")
 
         max_cols = 6
-        for idx, (p, _c) in enumerate(items[:120]):
+        for idx, (p, _c) in enumerate(items[:DISPLAY_LIMIT]):
             r, c = divmod(idx, max_cols)
             lbl = ttk.Label(self.suggest_items_frame, text=p, cursor="hand2")
             try: lbl.configure(font=("Segoe UI", 8))
@@ -301,6 +563,7 @@ class LoraPrepareApp(tk.Tk):
         if not messagebox.askyesno("Clear history", "Delete your frequently used words history? This cannot be undone."):
             return
         self.suggest.clear()
+        self.state.forget("history")
         self._refresh_suggestions()
 
     # ---- Text helpers (unique parts) ----
@@ -314,6 +577,43 @@ class LoraPrepareApp(tk.Tk):
                 combined.append(p)
         return combined, notes_parts  # combined for file; notes_parts for counting
 
+    # ---- Bulk re-captioning ----
+    def recaption_outputs(self):
+        """Rewrite captions already in the output dir(s) so they carry the current global words."""
+        if not self._finish_exports():
+            return
+        new_globals = parts_from_text(self.global_text.get("1.0", "end-1c"))
+        dropped = [p for p in self._applied_globals if p not in new_globals]
+        rules = CaptionRules(add=new_globals, remove=dropped, front=new_globals)
+        if rules.is_empty():
+            return
+        dirs = sorted({self.config.effective_output_dir_for(self._origin(item.path)) for item in self.images})
+        if not dirs:
+            chosen = filedialog.askdirectory(initialdir=self.last_open_dir, title="Select Output Folder to Update")
+            if not chosen:
+                return
+            dirs = [chosen]
+
+        self.configure(cursor="watch"); self.update_idletasks()
+        try:
+            preview = recaption_dirs(dirs, rules, dry_run=True)
+        finally:
+            self.configure(cursor="")
+        if not preview.changed:
+            messagebox.showinfo("Update captions", preview.summary(dry_run=True))
+            return
+        if not messagebox.askyesno("Update captions", preview.summary(dry_run=True) + "\n\nApply these changes?"):
+            return
+
+        self.configure(cursor="watch"); self.update_idletasks()
+        try:
+            result = recaption_dirs(dirs, rules, dry_run=False)
+        finally:
+            self.configure(cursor="")
+        self._applied_globals = new_globals
+        self._save_global_words()
+        messagebox.showinfo("Update captions", result.summary(dry_run=False))
+
     # ---- Navigation ----
     def _focused_in_text(self):
         try:
@@ -331,6 +631,12 @@ class LoraPrepareApp(tk.Tk):
         self.next_image()
         return "break"
 
+    def _ctrl_left_guard(self, event=None):
+        if self._focused_in_text():
+            return
+        self.previous_image()
+        return "break"
+
     def _set_initial_split(self):
         try:
             self.update_idletasks()
@@ -361,19 +667,37 @@ class LoraPrepareApp(tk.Tk):
             self.load_current()
             self.update_status()
         else:
-            self.images = []
-            self.idx = -1
-            self.viewport.clear()
-            self.file_label.config(text="No files loaded")
-            self.progress_label.config(text="—")
-            self.clear_notes()
-            messagebox.showinfo("Done", "No more images.")
+            self._queue_done()
+
+    def previous_image(self):
+        """Step back to the previous entry (already saved or skipped, now in processed) to redo it."""
+        if not self.images or self.idx <= 0 or not self._finish_exports():
+            return
+        self.idx -= 1
+        self.clear_notes()
+        self.load_current(claim=False)  # ours already; keep the lease on the entry we left
+        self.update_status()
+
+    def _queue_done(self):
+        if not self._finish_exports():
+            return
+        self.images = []
+        self.idx = -1
+        self.viewport.clear()
+        self.file_label.config(text="No files loaded")
+        self.progress_label.config(text="—")
+        self.clear_notes()
+        self._release_leases()
+        messagebox.showinfo("Done", "No more images.")
 
     def skip(self, move_current=True):
+        if move_current and not self._finish_exports():
+            return
         # Update suggestions (live) with notes text
         txt = self.note_text.get("1.0", "end-1c")
         if txt.strip():
             self.suggest.process_text_for_counts(txt)
+            self.state.mark_dirty("history")
             self._refresh_suggestions()  # <-- live refresh
 
         if move_current and self.images and 0 <= self.idx < len(self.images):
@@ -385,74 +709,274 @@ class LoraPrepareApp(tk.Tk):
             self.load_current()
             self.update_status()
         else:
-            self.images = []
-            self.idx = -1
-            self.viewport.clear()
-            self.file_label.config(text="No files loaded")
-            self.progress_label.config(text="—")
-            messagebox.showinfo("Done", "No more images.")
+            self._queue_done()
 
     # ---- Save ----
     def save_and_next(self):
         if not self.images:
             return
-        path = self.images[self.idx]
+        item = self.images[self.idx]
+        path = item.path
         try:
             out_img = self.viewport.get_crop_result_rgb()
             if out_img is None:
                 return
 
-            out_dir = self.config.effective_output_dir_for(path)
-            proc_dir = self.config.effective_processed_dir_for(path)
-            os.makedirs(out_dir, exist_ok=True)
-            os.makedirs(proc_dir, exist_ok=True)
-
-            stem, _ = os.path.splitext(os.path.basename(path))
+            out_dir = self.config.effective_output_dir_for(self._origin(path))
+            proc_dir = self.config.effective_processed_dir_for(self._origin(path))
 
-            # Save JPEG
-            img_out_path = self._unique_path(os.path.join(out_dir, f"{stem}.jpg"))
-            out_img.save(img_out_path, format="JPEG", quality=95, subsampling=1, optimize=True)
-
-            # Tags file
             combined, notes_parts = self._unique_combined_parts()
             combined_txt = ", ".join(combined).rstrip(", ")
-            txt_out_path = os.path.join(out_dir, f"{stem}.txt")
-            with open(txt_out_path, "w", encoding="utf-8") as f:
-                f.write(combined_txt)
-
-            # Update suggestions with only per-image notes (and refresh live)
-            if notes_parts:
-                self.suggest.process_text_for_counts(", ".join(notes_parts))
-                self._refresh_suggestions()  # <-- live refresh
-
-            # Move original to 'processed'
-            self._move_current_to_processed(proc_dir)
 
-            # Persist globals + config
-            self._save_global_words()
-            self._save_config()
+            # Saving an entry again (after Previous) overwrites its earlier image + tags file in place
+            profile_name = self.export_profile_var.get()
+            profile = self.config.get("export_profiles")[profile_name]
+            key = (item.path, item.frame)
+            prev = self.exported.get(key)
+            stem, replace = item.export_stem(), False
+            if prev is not None:
+                prev_dir, prev_name = os.path.split(prev["image_path"])
+                stem, prev_ext = os.path.splitext(prev_name)
+                ext = profile_ext(profile)
+                # Same stem unless a different profile's extension would hit someone else's file
+                replace = (os.path.abspath(prev_dir) == os.path.abspath(out_dir)
+                           and (prev_ext.lower() == ext or stem + ext not in self.names.get(out_dir)))
+
+            # Stages -> encode -> image + tags file (one collision-free stem) -> optional tar shard,
+            # on the export worker; _export_done() finishes up on the Tk thread
+            future = self.export_pool.submit(
+                export_frame, out_img, combined_txt, self.names.get(out_dir), stem, profile,
+                stages=self.config.get("process_stages") or [],
+                shard_writer=self._shard_writer_for(path) if self.shard_export_var.get() else None,
+                exclusive=self.shared_queue_var.get(),
+                metadata=export_metadata(item, self._origin(path), self.viewport.img_pil.size,
+                                         self.get_frame_size(), profile_name),
+                replace=replace,
+            )
         except Exception as e:
             messagebox.showerror("Save error", f"Failed to save or move file.\n\n{e}")
             return
+        self._exports.append((future, {
+            "pos": self.idx, "key": key, "label": item.label(), "prev": prev, "profile": profile_name,
+            "proc_dir": proc_dir,
+            # A multi-frame file stays put until its last queued frame is done
+            "last": not any(it.path == path for it in self._remaining()),
+            "notes": self.note_text.get("1.0", "end-1c"), "transform": self.viewport.frame_transform(),
+        }))
+        if self._export_poll is None:
+            self._export_poll = self.after(EXPORT_POLL_MS, self._poll_exports)
+
+        # Update suggestions with only per-image notes (and refresh live)
+        if notes_parts:
+            self.suggest.process_text_for_counts(", ".join(notes_parts))
+            self.state.mark_dirty("history")
+            self._refresh_suggestions()  # <-- live refresh
+        self._save_global_words()
 
         self.clear_notes()
         self.next_image()
 
+    def _poll_exports(self):
+        self._export_poll = None
+        while self._exports and self._exports[0][0].done():
+            self._export_done(*self._exports.popleft())
+        if self._exports:
+            self._export_poll = self.after(EXPORT_POLL_MS, self._poll_exports)
+
+    def _finish_exports(self) -> bool:
+        """
+        Wait for saves still in flight and finish them now (before anything that moves originals,
+        revisits entries or replaces the queue). False if one failed; its entry is shown again.
+        """
+        ok = True
+        while self._exports:
+            if not self._export_done(*self._exports.popleft()):
+                ok = False
+        return ok
+
+    def _export_done(self, future, ctx) -> bool:
+        """Tk-thread half of a save: record the export, clean up a replaced one, move the original."""
+        try:
+            result = future.result()
+        except Exception as e:
+            messagebox.showerror("Save error", f"Failed to save {ctx['label']}.\n\n{e}")
+            # Back to the entry (its original is still in the input folder) with its notes and crop
+            if 0 <= ctx["pos"] < len(self.images):
+                self.idx = ctx["pos"]
+                self.load_current(claim=False)
+                self.clear_notes()
+                self.note_text.insert("1.0", ctx["notes"])
+                S, dx, dy, frame = ctx["transform"]
+                if frame == self.get_frame_size():
+                    self.viewport.set_frame_transform(S, dx, dy)
+                self.update_status()
+            return False
+        key, prev = ctx["key"], ctx["prev"]
+        if prev is not None:
+            self._discard_export(prev, keep=(result["image_path"], result["txt_path"]))
+        self.exported[key] = {
+            "image_path": result["image_path"], "txt_path": result["txt_path"],
+            "notes": ctx["notes"], "transform": ctx["transform"],
+        }
+        self.stage_report_label.config(text=report_summary(result["stage_report"]))
+        record_stats(self.config.get("export_stats"), ctx["profile"], result["seconds"], result["bytes"])
+        self._update_export_stats_label()
+
+        # Move original to 'processed'
+        if ctx["last"]:
+            self._move_original(key[0], ctx["proc_dir"])
+        self._save_config()
+        return True
+
+    def _discard_export(self, prev, keep=()):
+        """After a re-save: delete the earlier export's files that the new one did not overwrite."""
+        keep = {os.path.abspath(p) for p in keep}
+        for path in (prev["image_path"], prev["txt_path"]):
+            if os.path.abspath(path) in keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self.names.get(os.path.dirname(path)).discard(os.path.basename(path))
+        if os.path.abspath(prev["image_path"]) not in keep:
+            image_dir, image_name = os.path.split(prev["image_path"])
+            mark_deleted(image_dir, image_name)
+
     def _move_current_to_processed(self, proc_dir=None):
+        src = self.images[self.idx].path
+        # A multi-frame file stays put until its last queued frame is done
+        if any(it.path == src for it in self._remaining()):
+            return
+        self._move_original(src, proc_dir)
+
+    def _move_original(self, src, proc_dir=None):
         try:
-            src = self.images[self.idx]
-            if proc_dir is None:
-                proc_dir = self.config.effective_processed_dir_for(src)
-            os.makedirs(proc_dir, exist_ok=True)
-            dest = os.path.join(proc_dir, os.path.basename(src))
-            if os.path.abspath(src) != os.path.abspath(dest):
-                if os.path.exists(dest):
-                    dest = self._unique_path(dest)
-                shutil.move(src, dest)
-                self.images[self.idx] = dest
+            self._move_to_processed(src, proc_dir)
         except Exception as e:
             messagebox.showwarning("Move warning", f"Could not move original to 'processed':\n{e}")
 
+    def _move_to_processed(self, src, proc_dir=None):
+        """Move src into its processed dir (unique name); returns the new path."""
+        if proc_dir is None:
+            proc_dir = self.config.effective_processed_dir_for(self._origin(src))
+        if os.path.abspath(os.path.dirname(src)) == os.path.abspath(proc_dir):
+            return src
+        dest = move_unique(src, self.names.get(proc_dir), exclusive=self.shared_queue_var.get())
+        self.origins[dest] = self.origins.pop(src, src)
+        self.triage.rename(src, dest)
+        if self.decoded_cache is not None:
+            self.decoded_cache.rename(src, dest)
+        for key in [k for k in self.exported if k[0] == src]:
+            self.exported[(dest, key[1])] = self.exported.pop(key)
+        for mgr in self.leases.values():
+            mgr.rename(src, dest)
+        self.images = [it.with_path(dest) if it.path == src else it for it in self.images]
+        return dest
+
+    # ---- Queue triage ----
+    def _start_triage(self):
+        self.triage.start(list(dict.fromkeys(item.path for item in self.images)))
+        self._update_triage_label()
+        if self._triage_poll is not None:
+            self.after_cancel(self._triage_poll)
+        self._triage_poll = self.after(150, self._poll_triage)
+
+    def _poll_triage(self):
+        self._triage_poll = None
+        if self.triage.drain():
+            self._update_triage_label()
+            if self.sort_mode_var.get() != SORT_MODES[0]:
+                self._sort_queue()
+        if self.triage.pending:
+            self._triage_poll = self.after(150, self._poll_triage)
+        else:
+            self.triage_cache.save()
+
+    def _is_flagged(self, item):
+        result = self.triage.get(item.path)
+        if self.flag_lowres_var.get() and is_low_res(result, self.get_frame_size()):
+            return True
+        if self.flag_blurry_var.get() and is_blurry(result):
+            return True
+        return False
+
+    def _remaining(self):
+        """Queue entries after the current image (the current one is never reordered or removed)."""
+        return self.images[self.idx + 1:] if self.images else []
+
+    def _update_triage_label(self):
+        if not self.images:
+            self.triage_label.config(text="")
+            return
+        frame = self.get_frame_size()
+        results = [self.triage.get(item.path) for item in self.images]
+        low = sum(1 for r in results if is_low_res(r, frame))
+        blurry = sum(1 for r in results if is_blurry(r))
+        text = f"{low} below {frame}px · {blurry} blurry"
+        if self.triage.pending:
+            text = f"Triage: {len(self.images) - self.triage.pending}/{len(self.images)} · " + text
+        self.triage_label.config(text=text)
+
+    def _sort_queue(self):
+        if not self.images:
+            return
+        mode = self.sort_mode_var.get()
+        rest = self._remaining()
+        if mode == SORT_MODES[0]:
+            return  # queue order: keep whatever order we have
+
+        def key(item):
+            r = self.triage.get(item.path)
+            if r is None:
+                return (1, 0.0)  # unscored files go last
+            return (0, min(r["w"], r["h"]) if mode == SORT_MODES[1] else r["blur"])
+
+        rest.sort(key=key)  # stable
+        self.images[self.idx + 1:] = rest
+        self.update_status()
+
+    def hide_flagged(self):
+        """Drop flagged images from the remaining queue; files stay where they are."""
+        rest = self._remaining()
+        keep = [it for it in rest if not self._is_flagged(it)]
+        if len(keep) == len(rest):
+            return
+        self.images[self.idx + 1:] = keep
+        self.update_status()
+        self._update_triage_label()
+
+    def skip_flagged(self):
+        """Move flagged images from the remaining queue straight to their processed dir."""
+        current = self.images[self.idx].path if self.images else None
+        flagged = list(dict.fromkeys(
+            it.path for it in self._remaining() if it.path != current and self._is_flagged(it)
+        ))
+        if not flagged:
+            return
+        if not messagebox.askyesno("Skip flagged", f"Move {len(flagged)} flagged image(s) to the processed folder?"):
+            return
+        shared = self.shared_queue_var.get()
+        gone, failed = set(), []
+        for p in flagged:
+            try:
+                if shared:
+                    mgr = self._leases_for(p)
+                    if not mgr.try_claim(p):
+                        gone.add(p)  # another operator has it; drop it from our queue
+                        continue
+                dest = self._move_to_processed(p)
+                if shared:
+                    mgr.release(dest)
+                gone.add(dest)
+            except Exception:
+                failed.append(p)
+        self.images[self.idx + 1:] = [it for it in self._remaining() if it.path not in gone]
+        self.update_status()
+        self._update_triage_label()
+        if failed:
+            messagebox.showwarning("Move warning", f"Could not move {len(failed)} file(s) to 'processed'.")
+
     # ---- Text / globals ----
     def clear_notes(self):
         if hasattr(self, "note_text"):
@@ -472,6 +996,7 @@ class LoraPrepareApp(tk.Tk):
             print(f"[icon] failed to apply app icon: {e}", file=sys.stderr)
 
     def _load_global_words(self):
+        text = None
         try:
             with open(self.global_words_path, "r", encoding="utf-8") as f:
                 text = f.read()
@@ -481,28 +1006,23 @@ class LoraPrepareApp(tk.Tk):
             pass
         except Exception:
             pass
+        self._applied_globals = parts_from_text(text or "")  # what existing outputs were written with
+        self.state.register("global_words", self.global_words_path,
+                            lambda: self.global_text.get("1.0", "end-1c"), current=text)
 
     def _save_global_words(self):
-        try:
-            text = self.global_text.get("1.0", "end-1c")
-            with open(self.global_words_path, "w", encoding="utf-8") as f:
-                f.write(text)
-        except Exception:
-            pass
+        self.state.mark_dirty("global_words")
 
     def on_close(self):
+        self._finish_exports()
+        self.export_pool.shutdown(wait=True)
         self._save_global_words()
         self._save_config()
+        self.state.flush()
+        self.triage.shutdown()
+        self.triage_cache.save()
+        if self.decoded_cache is not None:
+            self.decoded_cache.shutdown()
+        self._close_shards()
+        self._release_leases()
         self.destroy()
-
-    @staticmethod
-    def _unique_path(path):
-        if not os.path.exists(path):
-            return path
-        base, ext = os.path.splitext(path)
-        n = 1
-        while True:
-            cand = f"{base} ({n}){ext}"
-            if not os.path.exists(cand):
-                return cand
-            n += 1
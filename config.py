@@ -1,10 +1,24 @@
 # config.py
 import os
+import copy
 import json
 
+from fsutil import atomic_write
+
 CONFIG_FILE = "config.json"
-HISTORY_FILE = "suggest_history.txt"   # semicolon-separated: tag;count
+HISTORY_FILE = "suggest_history.txt"   # semicolon-separated: tag;count;last_use (older files: tag;count)
 GLOBAL_WORDS_FILE = "global_words.txt"
+TRIAGE_CACHE_FILE = "triage_cache.json"  # per-file dimensions + blur score
+
+# Named encoder profiles; "format" is the Pillow format, the rest are passed to Image.save().
+# Stored in config.json so users can add or tune their own.
+DEFAULT_EXPORT_PROFILE = "JPEG q95 (optimized)"
+DEFAULT_EXPORT_PROFILES = {
+    "JPEG q95 (optimized)": {"format": "JPEG", "quality": 95, "subsampling": 1, "optimize": True},
+    "JPEG q95 (fast)": {"format": "JPEG", "quality": 95, "subsampling": 1, "optimize": False},
+    "PNG (archival)": {"format": "PNG", "compress_level": 6},
+    "WebP q90": {"format": "WEBP", "quality": 90, "method": 4},
+}
 
 # Note: keep output_dir/processed_dir as RELATIVE defaults.
 # They will be resolved against the CURRENT IMAGE'S FOLDER when used.
@@ -14,13 +28,29 @@ DEFAULTS = {
     "output_dir": "output",        # relative to image folder
     "processed_dir": "processed",  # relative to image folder
     "last_open_dir": None,
+    "export_profile": DEFAULT_EXPORT_PROFILE,
+    "export_profiles": DEFAULT_EXPORT_PROFILES,
+    "export_stats": {},            # profile name -> {"count", "seconds", "bytes"}
+    "shard_export": False,         # also stream exports into WebDataset-style tar shards
+    "shard_dir": "shards",         # relative to image folder
+    "shard_max_mb": 1024,
+    "shared_queue": False,         # claim images with lease files so several instances can share a folder
+    "coord_dir": ".lora-leases",   # lease files; relative to image folder
+    "lease_ttl": 300,              # seconds before an unrenewed claim can be taken over
+    "suggest_capacity": 2000,      # max tags kept in suggest_history.txt
+    "suggest_decay_every": 200,    # captions between count decay steps
+    "suggest_decay_factor": 0.9,
+    "process_stages": [],          # post-crop stages run before encoding (see stages.STAGES)
+    "viewport_bake_dim": True,     # dim outside the frame in the render buffer instead of stipple overlays
+    "decoded_cache_dir": "decoded_cache",  # raw decoded pixels for Previous; relative to the app folder
+    "decoded_cache_mb": 2048,      # LRU size limit; 0 disables the cache
 }
 
 class AppConfig:
     def __init__(self, app_dir: str):
         self.app_dir = app_dir
         self.path = os.path.join(app_dir, CONFIG_FILE)
-        self.data = dict(DEFAULTS)
+        self.data = copy.deepcopy(DEFAULTS)
         self.load()
 
         # Ensure we have *some* string values (stay relative by default)
@@ -28,6 +58,12 @@ class AppConfig:
             self.data["output_dir"] = DEFAULTS["output_dir"]
         if not isinstance(self.data.get("processed_dir"), str) or not self.data["processed_dir"].strip():
             self.data["processed_dir"] = DEFAULTS["processed_dir"]
+        if not isinstance(self.data.get("export_profiles"), dict) or not self.data["export_profiles"]:
+            self.data["export_profiles"] = copy.deepcopy(DEFAULT_EXPORT_PROFILES)
+        if self.data.get("export_profile") not in self.data["export_profiles"]:
+            self.data["export_profile"] = next(iter(self.data["export_profiles"]))
+        if not isinstance(self.data.get("export_stats"), dict):
+            self.data["export_stats"] = {}
 
     def load(self):
         try:
@@ -37,11 +73,13 @@ class AppConfig:
         except Exception:
             pass
 
-    def save(self):
+    def dumps(self) -> str:
         # Persist exactly what the user entered (relative paths stay relative)
+        return json.dumps(self.data, indent=2)
+
+    def save(self):
         try:
-            with open(self.path, "w", encoding="utf-8") as f:
-                json.dump(self.data, f, indent=2)
+            atomic_write(self.path, self.dumps())
         except Exception:
             pass
 
@@ -76,3 +114,9 @@ class AppConfig:
 
     def effective_processed_dir_for(self, src_path: str) -> str:
         return self._resolve_for_image(self.get("processed_dir", DEFAULTS["processed_dir"]), src_path)
+
+    def effective_shard_dir_for(self, src_path: str) -> str:
+        return self._resolve_for_image(self.get("shard_dir", DEFAULTS["shard_dir"]), src_path)
+
+    def effective_coord_dir_for(self, src_path: str) -> str:
+        return self._resolve_for_image(self.get("coord_dir", DEFAULTS["coord_dir"]), src_path)
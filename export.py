@@ -0,0 +1,144 @@
+import io
+import os
+import time
+
+from PIL import Image
+
+from fsutil import atomic_write
+from stages import StagePipeline
+from metaindex import append_record
+
+# Pillow format -> file extension used for the exported image
+FORMAT_EXTS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp"}
+
+# Image.save() keyword arguments each format understands; anything else in a profile is ignored
+FORMAT_OPTIONS = {
+    "JPEG": {"quality", "subsampling", "optimize", "progressive"},
+    "PNG": {"compress_level", "optimize"},
+    "WEBP": {"quality", "method", "lossless"},
+}
+
+def crop_to_frame(img, S: float, dx: float, dy: float, frame: int):
+    """
+    Render the square frame as an RGB (frame, frame) image, letterboxed black.
+    Same transform model as ImageViewport: the image is scaled by S and its top-left
+    corner sits at (dx, dy), here measured from the frame's top-left corner.
+    """
+    left_img   = -dx / S
+    top_img    = -dy / S
+    right_img  = (frame - dx) / S
+    bottom_img = (frame - dy) / S
+
+    iw, ih = img.size
+    inter_left   = max(0, left_img)
+    inter_top    = max(0, top_img)
+    inter_right  = min(iw, right_img)
+    inter_bottom = min(ih, bottom_img)
+
+    out = Image.new("RGB", (frame, frame), (0, 0, 0))
+    if inter_right > inter_left and inter_bottom > inter_top:
+        crop = img.crop((
+            int(inter_left), int(inter_top), int(inter_right), int(inter_bottom)
+        )).convert("RGB")
+
+        dest_x = int(round(inter_left * S + dx))
+        dest_y = int(round(inter_top * S + dy))
+
+        target_w = max(1, int(round((inter_right - inter_left) * S)))
+        target_h = max(1, int(round((inter_bottom - inter_top) * S)))
+        if crop.size != (target_w, target_h):
+            crop = crop.resize((target_w, target_h), Image.LANCZOS)
+
+        out.paste(crop, (dest_x, dest_y))
+    return out
+
+def export_frame(img, caption: str, out_index, stem: str, profile: dict,
+                 stages=(), shard_writer=None, exclusive: bool = False, metadata=None, replace: bool = False):
+    """
+    Shared export path (GUI and crop service): post-crop stages, encode, then write
+    <stem>.<ext> + <stem>.txt atomically under a collision-free stem from out_index,
+    and optionally stream the same bytes into a tar shard.
+    exclusive: also claim the names on disk (folders shared with other instances).
+    metadata: extra fields (source, frame_size, profile, ...) for the record appended
+    to the output dir's metadata index; None writes no record.
+    replace: write under stem exactly, atomically replacing an earlier export with that stem.
+    """
+    out_img, stage_report = StagePipeline(stages).run(img)
+    data, ext, seconds = encode(out_img, profile)
+    if replace:
+        out_stem = stem
+        new_names = [out_stem + e for e in (ext, ".txt") if out_stem + e not in out_index]
+        for name in new_names:
+            out_index.add(name)
+    else:
+        if exclusive:
+            out_stem = out_index.claim_stem(stem, (ext, ".txt"))
+        else:
+            out_stem = out_index.reserve_stem(stem, (ext, ".txt"))
+        new_names = [out_stem + ext, out_stem + ".txt"]
+    image_path = os.path.join(out_index.directory, out_stem + ext)
+    txt_path = os.path.join(out_index.directory, out_stem + ".txt")
+    try:
+        atomic_write(image_path, data)
+        atomic_write(txt_path, caption)
+    except BaseException:
+        # Undo the names this call took (placeholders, a half-written pair) so disk and index agree;
+        # files an earlier export left under the replaced stem stay as they are
+        for name in new_names:
+            try:
+                os.remove(os.path.join(out_index.directory, name))
+            except OSError:
+                pass
+            out_index.discard(name)
+        raise
+    if shard_writer is not None:
+        shard_writer.write(out_stem, {ext: data, "txt": caption})
+    if metadata is not None:
+        append_record(out_index.directory, {
+            "file": out_stem + ext, "caption": caption, "width": out_img.width, "height": out_img.height,
+            **metadata, "time": round(time.time(), 3),
+        })
+    return {
+        "stem": out_stem,
+        "image_path": image_path,
+        "txt_path": txt_path,
+        "size": out_img.size,
+        "bytes": len(data),
+        "seconds": seconds,
+        "stage_report": stage_report,
+    }
+
+def profile_ext(profile: dict) -> str:
+    return FORMAT_EXTS.get(str(profile.get("format", "JPEG")).upper(), ".jpg")
+
+def encode(img, profile: dict):
+    """
+    Encode an image in memory with the given profile.
+    Returns (data: bytes, ext: str, seconds: float).
+    """
+    fmt = str(profile.get("format", "JPEG")).upper()
+    if fmt not in FORMAT_OPTIONS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    opts = {k: v for k, v in profile.items() if k in FORMAT_OPTIONS[fmt]}
+    buf = io.BytesIO()
+    t0 = time.perf_counter()
+    img.save(buf, format=fmt, **opts)
+    seconds = time.perf_counter() - t0
+    return buf.getvalue(), profile_ext(profile), seconds
+
+def record_stats(stats: dict, name: str, seconds: float, nbytes: int):
+    """Accumulate encode time and output size for a profile (stats lives in config.json)."""
+    s = stats.setdefault(name, {"count": 0, "seconds": 0.0, "bytes": 0})
+    s["count"] += 1
+    s["seconds"] = round(s["seconds"] + seconds, 4)
+    s["bytes"] += int(nbytes)
+
+def stats_summary(stats: dict, name: str) -> str:
+    """Human readable averages for one profile, e.g. '42 ms · 310 KB avg (12 images)'."""
+    s = stats.get(name)
+    if not s or not s.get("count"):
+        return "no exports yet"
+    n = s["count"]
+    ms = 1000.0 * s["seconds"] / n
+    kb = s["bytes"] / n / 1024.0
+    return f"{ms:.0f} ms · {kb:.0f} KB avg ({n} image{'s' if n != 1 else ''})"
@@ -0,0 +1,70 @@
+import os
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+SUPPORTED_EXTS = {".jpg", ".jpeg", ".png", ".bmp", ".tiff", ".tif", ".webp", ".gif"}
+FRAME_SCAN_WORKERS = max(2, min(8, (os.cpu_count() or 2)))
+
+class QueueItem(NamedTuple):
+    """
+    One entry in the image queue. Multi-frame files (animated GIF/WebP, multi-page TIFF)
+    become one virtual entry per frame; nothing is decoded until the entry is shown.
+    """
+    path: str
+    frame: int = 0
+    n_frames: int = 1
+
+    @property
+    def is_frame(self) -> bool:
+        return self.n_frames > 1
+
+    def label(self) -> str:
+        name = os.path.basename(self.path)
+        return f"{name} [frame {self.frame + 1}/{self.n_frames}]" if self.is_frame else name
+
+    def export_stem(self) -> str:
+        """Output stem; frames get a zero-padded suffix so they sort in playback order."""
+        stem, _ = os.path.splitext(os.path.basename(self.path))
+        return f"{stem}_f{self.frame:04d}" if self.is_frame else stem
+
+    def with_path(self, path: str) -> "QueueItem":
+        return self._replace(path=path)
+
+def list_images(paths):
+    """Expand files and folders (non-recursive, sorted) into supported image files."""
+    files = []
+    for p in paths:
+        p = os.path.abspath(p)
+        if os.path.isdir(p):
+            with os.scandir(p) as it:
+                names = sorted(e.name for e in it if e.is_file())
+            files.extend(os.path.join(p, n) for n in names if os.path.splitext(n)[1].lower() in SUPPORTED_EXTS)
+        elif os.path.splitext(p)[1].lower() in SUPPORTED_EXTS:
+            files.append(p)
+    return files
+
+def count_frames(path: str) -> int:
+    """Frame count from the container (lazy open; frame pixel data is not decoded)."""
+    try:
+        with Image.open(path) as im:
+            return max(1, int(getattr(im, "n_frames", 1)))
+    except Exception:
+        return 1
+
+def expand_paths(paths, max_workers: int = FRAME_SCAN_WORKERS):
+    """Turn file paths into queue items, one per frame for multi-frame files (order preserved)."""
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="frames") as pool:
+        counts = list(pool.map(count_frames, paths))
+    items = []
+    for path, n in zip(paths, counts):
+        items.extend(QueueItem(path, i, n) for i in range(n))
+    return items
+
+def open_item(item: QueueItem):
+    """Open the file and seek to the item's frame; pixels decode when the image is first used."""
+    im = Image.open(item.path)
+    if item.is_frame:
+        im.seek(item.frame)
+    return im
@@ -0,0 +1,200 @@
+import os
+import errno
+import shutil
+import threading
+import uuid
+
+def _key(name: str) -> str:
+    # Windows and macOS are case-insensitive by default; treat names that way everywhere
+    return name.casefold()
+
+class NameIndex:
+    """
+    In-memory set of the file names in one directory, built once with os.scandir.
+    Hands out collision-free names ("name (1).ext", "name (2).ext", ...) without
+    touching the disk; the next free suffix is remembered per stem, so repeated
+    stems like IMG_0001 resolve in O(1) instead of probing from (1) every time.
+    Only this process writes through the index, so keep it updated via reserve()/add()/discard().
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._names = set()
+        self._next = {}  # (stem key, exts key) -> next suffix number to try
+        self._lock = threading.Lock()
+        with os.scandir(directory) as it:
+            for entry in it:
+                self._names.add(_key(entry.name))
+
+    def __contains__(self, name: str) -> bool:
+        return _key(name) in self._names
+
+    def add(self, name: str):
+        with self._lock:
+            self._names.add(_key(name))
+
+    def discard(self, name: str):
+        with self._lock:
+            self._names.discard(_key(name))
+
+    def reserve_stem(self, stem: str, exts):
+        """
+        Pick a stem such that stem+ext is free for every ext (e.g. image + caption pair),
+        mark those names as taken and return the stem.
+        """
+        exts = tuple(exts)
+        with self._lock:
+            if all(_key(stem + e) not in self._names for e in exts):
+                chosen = stem
+            else:
+                slot = (_key(stem), tuple(_key(e) for e in exts))
+                n = self._next.get(slot, 1)
+                while any(_key(f"{stem} ({n}){e}") in self._names for e in exts):
+                    n += 1
+                self._next[slot] = n + 1
+                chosen = f"{stem} ({n})"
+            for e in exts:
+                self._names.add(_key(chosen + e))
+            return chosen
+
+    def reserve(self, name: str) -> str:
+        """Reserve a free file name based on name; returns the name to use."""
+        stem, ext = os.path.splitext(name)
+        return self.reserve_stem(stem, (ext,)) + ext
+
+    def claim_stem(self, stem: str, exts):
+        """
+        reserve_stem() for folders shared with other processes: also creates empty placeholder
+        files with O_EXCL, so another instance cannot take the same names. atomic_write() and
+        atomic_move() then replace the placeholders. Names that turn out to exist are skipped.
+        """
+        exts = tuple(exts)
+        while True:
+            chosen = self.reserve_stem(stem, exts)
+            created = []
+            try:
+                for e in exts:
+                    path = os.path.join(self.directory, chosen + e)
+                    os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+                    created.append(path)
+                return chosen
+            except FileExistsError:
+                for path in created:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+
+    def claim(self, name: str) -> str:
+        stem, ext = os.path.splitext(name)
+        return self.claim_stem(stem, (ext,)) + ext
+
+class NameIndexRegistry:
+    """One NameIndex per resolved directory, created (and the directory made) on first use."""
+    def __init__(self):
+        self._indexes = {}
+        self._lock = threading.Lock()
+
+    def get(self, directory: str) -> NameIndex:
+        directory = os.path.abspath(directory)
+        with self._lock:
+            index = self._indexes.get(directory)
+            if index is None:
+                os.makedirs(directory, exist_ok=True)
+                index = NameIndex(directory)
+                self._indexes[directory] = index
+            return index
+
+def _temp_path_for(path: str) -> str:
+    d, name = os.path.split(path)
+    return os.path.join(d, f".{name}.{uuid.uuid4().hex[:8]}.tmp")
+
+def atomic_write(path: str, data, fsync: bool = True):
+    """
+    Write bytes (or str, as UTF-8) to a temp file next to path, fsync, then rename over path.
+    Readers see either the old file or the complete new one, never a truncated file.
+    fsync=False skips the flush to disk (still atomic for readers, less durable on power loss).
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    tmp = _temp_path_for(path)
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+def _rename_new(src: str, dest: str):
+    """Rename src to dest, raising FileExistsError instead of replacing an existing dest."""
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        raise
+    except OSError as e:
+        if e.errno == errno.EXDEV:
+            raise
+        # No hard links on this filesystem (FAT/exFAT, some shares): hold the name with O_EXCL
+        os.close(os.open(dest, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        try:
+            os.replace(src, dest)
+        except BaseException:
+            try:
+                os.remove(dest)
+            except OSError:
+                pass
+            raise
+        return
+    os.unlink(src)
+
+def atomic_move(src: str, dest: str, overwrite: bool = False):
+    """
+    Move src to dest. Same filesystem: a single atomic rename (link + unlink unless overwrite).
+    Across filesystems: copy to a temp file in dest's folder, move that into place, then delete src.
+    Without overwrite an existing dest is never replaced (FileExistsError); pass overwrite=True
+    for a placeholder made by NameIndex.claim().
+    """
+    place = os.replace if overwrite else _rename_new
+    try:
+        place(src, dest)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    tmp = _temp_path_for(dest)
+    try:
+        shutil.copy2(src, tmp)
+        place(tmp, dest)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    os.remove(src)
+
+def move_unique(src: str, index: NameIndex, exclusive: bool = False) -> str:
+    """
+    Move src into index.directory under a free name (same rules as export names); returns the
+    new path. A name that turns up on disk after the index was scanned is kept as taken and the
+    next one is tried, so nothing already there is overwritten.
+    exclusive: claim the name on disk first (folders shared with other instances).
+    """
+    base = os.path.basename(src)
+    while True:
+        name = index.claim(base) if exclusive else index.reserve(base)
+        dest = os.path.join(index.directory, name)
+        try:
+            atomic_move(src, dest, overwrite=exclusive)
+            return dest
+        except FileExistsError:
+            continue
+        except BaseException:
+            index.discard(name)
+            raise
@@ -0,0 +1,201 @@
+import os
+import mmap
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+_MAGIC = b"LPDC"
+_HEADER = struct.Struct("<4sH8sII")  # magic, version, mode, width, height
+_HEADER_SIZE = 32                    # pixel data starts here (header padded)
+_VERSION = 1
+_EXT = ".raw"
+
+def _stored_mode(im):
+    """Keep the cheap modes as decoded; anything else is stored as the RGBA the viewport converts to."""
+    return im.mode if im.mode in ("RGB", "RGBA", "L") else "RGBA"
+
+class DecodedImageCache:
+    """
+    On-disk cache of decoded pixels for recently shown queue items, so going back to one
+    skips the decoder (large PNG/WebP, 16-bit TIFF). Each entry is one raw file (small header +
+    packed RGB/RGBA/L rows) keyed by path + mtime + size + frame; get() memory-maps it and wraps
+    the mapping with Image.frombuffer, so a hit costs page faults rather than a decode or a copy.
+    Entries are written on a background thread and evicted least-recently-used past max_bytes.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> file size, least recently used first
+        self._paths = {}               # key -> (path, frame) for entries written this session
+        self._pending = {}             # key -> image still being written
+        self._renamed = {}             # key a pending write was queued under -> key it moved to
+        self._total = 0
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="imagecache")
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.name.endswith(".tmp"):
+                    try:
+                        os.remove(entry.path)  # interrupted write
+                    except OSError:
+                        pass
+                elif entry.name.endswith(_EXT):
+                    st = entry.stat()
+                    found.append((st.st_mtime, entry.name[:-len(_EXT)], st.st_size))
+        for _mtime, key, size in sorted(found):
+            self._entries[key] = size
+            self._total += size
+
+    @staticmethod
+    def _key(path: str, frame: int = 0):
+        """None if the file is gone; a changed file gets a new key, so stale pixels are never served."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        ident = f"{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{frame}"
+        return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.directory, key + _EXT)
+
+    def get(self, path: str, frame: int = 0):
+        """Decoded image for path/frame, or None on a miss."""
+        key = self._key(path, frame)
+        if key is None:
+            return None
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is not None:
+                return pending
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            im = self._map(self._file(key))
+            os.utime(self._file(key))  # LRU order survives restarts
+            return im
+        except (OSError, ValueError):
+            self._drop(key)
+            return None
+
+    def _map(self, file_path: str):
+        with open(file_path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, mode, w, h = _HEADER.unpack_from(mm, 0)
+        mode = mode.rstrip(b"\0").decode("ascii")
+        if magic != _MAGIC or version != _VERSION or len(mm) != _HEADER_SIZE + w * h * len(mode):
+            mm.close()
+            raise ValueError(f"corrupt cache entry {file_path}")
+        # The image keeps the memoryview (and so the mapping) alive; pages load on demand
+        return Image.frombuffer(mode, (w, h), memoryview(mm)[_HEADER_SIZE:], "raw", mode, 0, 1)
+
+    def put(self, path: str, frame: int, im):
+        """Queue a decoded image for writing; im must not be modified afterwards."""
+        key = self._key(path, frame)
+        if key is None:
+            return
+        with self._lock:
+            if key in self._entries or key in self._pending:
+                return
+            self._pending[key] = im
+            self._paths[key] = (path, frame)
+        self._pool.submit(self._write, key, im)
+
+    def _store(self, key: str, size: int):
+        """Account an entry under the lock; replacing an existing key does not count it twice."""
+        old = self._entries.pop(key, None)
+        self._entries[key] = size
+        self._total += size - (old or 0)
+
+    def _final_key(self, key: str) -> str:
+        while key in self._renamed:
+            key = self._renamed.pop(key)
+        return key
+
+    def _write(self, key: str, im):
+        tmp = self._file(key) + ".tmp"
+        try:
+            mode = _stored_mode(im)
+            if im.mode != mode:
+                im = im.convert(mode)
+            header = _HEADER.pack(_MAGIC, _VERSION, mode.encode("ascii"), im.width, im.height)
+            data = im.tobytes()
+            with open(tmp, "wb") as f:
+                f.write(header.ljust(_HEADER_SIZE, b"\0"))
+                f.write(data)
+            with self._lock:
+                # The source may have moved (rename()) while this was written
+                key = self._final_key(key)
+                os.replace(tmp, self._file(key))  # disposable cache: no fsync
+                self._store(key, _HEADER_SIZE + len(data))
+                self._pending.pop(key, None)
+        except Exception:
+            with self._lock:
+                key = self._final_key(key)
+                self._pending.pop(key, None)
+                self._paths.pop(key, None)
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+        self._evict()
+
+    def _evict(self):
+        while True:
+            with self._lock:
+                if self._total <= self.max_bytes or len(self._entries) <= 1:
+                    return
+                key = next(iter(self._entries))
+            self._drop(key)
+
+    def _drop(self, key: str):
+        with self._lock:
+            size = self._entries.pop(key, None)
+            self._paths.pop(key, None)
+            if size is not None:
+                self._total -= size
+        try:
+            os.remove(self._file(key))
+        except OSError:
+            pass  # still mapped (Windows) or already gone
+
+    def rename(self, src: str, dest: str):
+        """
+        The file moved (e.g. into processed/); re-key its entries right away so a get(dest)
+        straight after the move still hits. A write still in flight lands under the new key.
+        """
+        with self._lock:
+            moved = [(key, frame) for key, (path, frame) in self._paths.items() if path == src]
+        for key, frame in moved:
+            new_key = self._key(dest, frame)
+            if new_key is None or new_key == key:
+                continue
+            with self._lock:
+                self._paths.pop(key, None)
+                self._paths[new_key] = (dest, frame)
+                if key in self._pending:
+                    self._pending[new_key] = self._pending.pop(key)
+                    self._renamed[key] = new_key
+                    continue
+                size = self._entries.pop(key, None)
+                if size is None:
+                    continue
+                self._total -= size
+            try:
+                os.replace(self._file(key), self._file(new_key))
+            except OSError:
+                with self._lock:
+                    self._paths.pop(new_key, None)
+                continue
+            with self._lock:
+                self._store(new_key, size)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=True)
@@ -0,0 +1,138 @@
+import os
+import json
+import time
+import uuid
+import socket
+import hashlib
+
+LEASE_TTL = 300  # seconds a claim stays valid without renewal
+
+class LeaseManager:
+    """
+    Cross-process work claims for a shared input folder, using one lock file per image in a
+    coordination directory. A claim is an O_CREAT|O_EXCL create (atomic on local disks, SMB and NFSv3+),
+    renewed by touching the file. A lock whose mtime is older than the TTL belongs to a crashed
+    or closed instance and may be taken over.
+    """
+    def __init__(self, coord_dir: str, ttl: float = LEASE_TTL):
+        self.coord_dir = coord_dir
+        self.base_dir = os.path.dirname(os.path.abspath(coord_dir))  # lock keys are relative to this
+        self.ttl = float(ttl)
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.held = {}  # image path -> lock file path
+        os.makedirs(coord_dir, exist_ok=True)
+
+    def _key(self, path: str) -> str:
+        """
+        The image path relative to the folder holding coord_dir, with "/" separators: the share may be
+        mounted at a different drive letter, UNC path or mount point on each machine, but this key is the same.
+        """
+        try:
+            rel = os.path.relpath(os.path.abspath(path), self.base_dir)
+        except ValueError:
+            rel = os.path.abspath(path)  # different drive from coord_dir (Windows); nothing shared to key on
+        return rel.replace(os.sep, "/")
+
+    def _lock_path(self, key: str) -> str:
+        return os.path.join(self.coord_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock")
+
+    def _server_now(self) -> float:
+        """
+        The file server's current time: the mtime of a file just written in coord_dir. Lock mtimes are
+        compared against this rather than time.time(), so clients whose clocks disagree with the server
+        neither take over live leases nor keep stale ones.
+        """
+        clock = os.path.join(self.coord_dir, ".clock")
+        with open(clock, "w", encoding="utf-8") as f:
+            f.write(self.owner)
+        return os.stat(clock).st_mtime
+
+    def _expired(self, lock_path: str, now: float) -> bool:
+        try:
+            return os.stat(lock_path).st_mtime + self.ttl < now
+        except FileNotFoundError:
+            return True
+
+    def _create(self, lock_path: str, key: str) -> bool:
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"owner": self.owner, "key": key, "claimed": time.time()}, f)
+        return True
+
+    def try_claim(self, path: str) -> bool:
+        """Claim path for this instance. False if another live instance holds it or it is gone."""
+        if path in self.held:
+            return True
+        key = self._key(path)
+        lock_path = self._lock_path(key)
+        if not self._create(lock_path, key):
+            now = self._server_now()
+            if not self._expired(lock_path, now):
+                return False
+            # Stale lease: rename it away first so only one instance can win the takeover
+            tomb = f"{lock_path}.{self.owner}.stale"
+            try:
+                os.rename(lock_path, tomb)
+            except OSError:
+                return False
+            if not self._expired(tomb, now):
+                # Lost a race with a fresh claim; put it back if nobody re-created it meanwhile
+                try:
+                    if os.path.exists(lock_path):
+                        os.remove(tomb)
+                    else:
+                        os.rename(tomb, lock_path)
+                except OSError:
+                    pass
+                return False
+            try:
+                os.remove(tomb)
+            except OSError:
+                pass
+            if not self._create(lock_path, key):
+                return False
+        self.held[path] = lock_path
+        if not os.path.exists(path):
+            # Someone else finished it between our queue scan and the claim
+            self.release(path)
+            return False
+        return True
+
+    def rename(self, old: str, new: str):
+        """Keep the lease under the image's new path (e.g. after moving it to processed)."""
+        if old in self.held:
+            self.held[new] = self.held.pop(old)
+
+    def _owned(self, lock_path: str) -> bool:
+        try:
+            with open(lock_path, "r", encoding="utf-8") as f:
+                return json.load(f).get("owner") == self.owner
+        except (OSError, ValueError):
+            return False
+
+    def renew_all(self):
+        """Touch every held lock; leases taken over by another instance (we stalled past the TTL) are dropped."""
+        for path, lock_path in list(self.held.items()):
+            if not self._owned(lock_path):
+                del self.held[path]
+                continue
+            try:
+                os.utime(lock_path, None)
+            except OSError:
+                pass
+
+    def release(self, path: str):
+        lock_path = self.held.pop(path, None)
+        if lock_path and self._owned(lock_path):
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+
+    def release_all(self, keep=()):
+        for path in list(self.held):
+            if path not in keep:
+                self.release(path)
@@ -1,8 +1,151 @@
-from app import LoraPrepareApp
+import os
+import sys
+import json
+import argparse
 
-def main():
+def _app_dir():
+    return os.path.dirname(os.path.abspath(sys.argv[0]))
+
+def _parts(values):
+    """Flatten repeated comma-separated option values into one list."""
+    out = []
+    for v in values or []:
+        out.extend(p.strip() for p in v.split(",") if p.strip())
+    return out
+
+def cmd_recaption(args):
+    from recaption import CaptionRules, recaption_dirs, RECAPTION_WORKERS
+    replace = {}
+    for item in args.replace or []:
+        if "=" not in item:
+            print(f"--replace expects OLD=NEW, got {item!r}", file=sys.stderr)
+            return 2
+        old, new = item.split("=", 1)
+        replace[old.strip()] = new.strip()
+    rules = CaptionRules(add=_parts(args.add), remove=_parts(args.remove), replace=replace, front=_parts(args.front))
+    if rules.is_empty():
+        print("Nothing to do: pass at least one of --add/--remove/--replace/--front.", file=sys.stderr)
+        return 2
+    result = recaption_dirs(args.dirs, rules, dry_run=args.dry_run, max_workers=args.workers or RECAPTION_WORKERS)
+    print(result.summary(args.dry_run))
+    return 1 if result.errors else 0
+
+def cmd_reindex(args):
+    from metaindex import rebuild_index, index_path, REBUILD_WORKERS
+    status = 0
+    for directory in args.dirs:
+        if not os.path.isdir(directory):
+            print(f"{directory}: not a folder", file=sys.stderr)
+            status = 2
+            continue
+        count, errors = rebuild_index(directory, max_workers=args.workers or REBUILD_WORKERS)
+        print(f"{index_path(directory)}: {count} record(s)")
+        for name, error in errors[:5]:
+            print(f"  skipped {name}: {error}", file=sys.stderr)
+        if errors:
+            status = 1
+    return status
+
+def cmd_serve(args):
+    from config import AppConfig, GLOBAL_WORDS_FILE
+    from frames import list_images
+    from service import CropService, serve, SERVICE_WORKERS
+    files = list_images(args.paths)
+    if not files:
+        print("No supported images found.", file=sys.stderr)
+        return 2
+    app_dir = _app_dir()
+    global_words = ""
+    try:
+        with open(os.path.join(app_dir, GLOBAL_WORDS_FILE), "r", encoding="utf-8") as f:
+            global_words = f.read()
+    except OSError:
+        pass
+    service = CropService(AppConfig(app_dir), files, global_words, max_workers=args.workers or SERVICE_WORKERS)
+    serve(service, args.host, args.port)
+    return 0
+
+def cmd_record(args):
+    from app import LoraPrepareApp
+    from viewtrace import TraceRecorder
     app = LoraPrepareApp()
+    recorder = TraceRecorder(app.viewport)
     app.mainloop()
+    recorder.save(args.trace)
+    print(f"Recorded {len(recorder.events)} viewport event(s) to {args.trace}")
+    return 0
+
+def cmd_replay(args):
+    import tkinter as tk
+    from viewtrace import replay_file, format_report
+    if args.speed <= 0:
+        print("--speed must be positive", file=sys.stderr)
+        return 2
+    try:
+        report = replay_file(args.trace, args.image, realtime=not args.fast, speed=args.speed,
+                             bake_dim=not args.no_bake_dim)
+    except tk.TclError as e:
+        print(f"Cannot open a display ({e}); run under a virtual X server, e.g. xvfb-run python main.py replay ...",
+              file=sys.stderr)
+        return 2
+    print(format_report(report))
+    if args.json:
+        from fsutil import atomic_write
+        atomic_write(args.json, json.dumps(report, indent=2))
+    return 0
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="main.py", description="Lora Prepare Tool (no arguments starts the GUI)")
+    sub = parser.add_subparsers(dest="command")
+
+    p = sub.add_parser("recaption", help="bulk-edit the .txt captions in existing output folders")
+    p.add_argument("dirs", nargs="+", help="output folder(s) containing image + .txt pairs")
+    p.add_argument("--add", action="append", help="parts to add (comma-separated, repeatable)")
+    p.add_argument("--remove", action="append", help="parts to remove (comma-separated, repeatable)")
+    p.add_argument("--replace", action="append", metavar="OLD=NEW", help="rename a part (repeatable)")
+    p.add_argument("--front", action="append", help="parts to move to the front, in this order")
+    p.add_argument("--dry-run", action="store_true", help="only report what would change")
+    p.add_argument("--workers", type=int, default=0, help="thread pool size")
+    p.set_defaults(func=cmd_recaption)
+
+    p = sub.add_parser("reindex", help="rebuild the metadata.jsonl index of output folders from their files")
+    p.add_argument("dirs", nargs="+", help="output folder(s) containing image + .txt pairs")
+    p.add_argument("--workers", type=int, default=0, help="thread pool size")
+    p.set_defaults(func=cmd_reindex)
+
+    p = sub.add_parser("serve", help="HTTP crop service for thin clients (previews + server-side export)")
+    p.add_argument("paths", nargs="+", help="image files and/or folders to queue")
+    p.add_argument("--host", default="127.0.0.1", help="bind address (default: localhost only)")
+    p.add_argument("--port", type=int, default=8765)
+    p.add_argument("--workers", type=int, default=0, help="decode/encode worker pool size")
+    p.set_defaults(func=cmd_serve)
+
+    p = sub.add_parser("record", help="run the GUI and log viewport input events to a trace file")
+    p.add_argument("trace", help="trace file to write on exit (JSON lines)")
+    p.set_defaults(func=cmd_record)
+
+    p = sub.add_parser("replay", help="replay a viewport trace and report per-event render latency")
+    p.add_argument("trace", help="trace file written by 'record'")
+    p.add_argument("--image", help="image to load for every load event (default: noise of the recorded size)")
+    p.add_argument("--fast", action="store_true", help="issue events back to back instead of at recorded times")
+    p.add_argument("--speed", type=float, default=1.0, help="playback speed factor for realtime pacing")
+    p.add_argument("--no-bake-dim", action="store_true", help="draw the dimming with stipple rectangles")
+    p.add_argument("--json", help="also write the full report as JSON")
+    p.set_defaults(func=cmd_replay)
+    return parser
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        from app import LoraPrepareApp
+        app = LoraPrepareApp()
+        app.mainloop()
+        return 0
+    args = build_parser().parse_args(argv)
+    if not getattr(args, "func", None):
+        build_parser().print_help()
+        return 2
+    return args.func(args)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,147 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from fsutil import atomic_write
+
+INDEX_FILE = "metadata.jsonl"  # one JSON line per export, in each output dir
+IMAGE_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".tif", ".tiff"}
+REBUILD_WORKERS = max(4, min(32, (os.cpu_count() or 4) * 2))  # I/O bound: oversubscribe
+
+def index_path(directory: str) -> str:
+    return os.path.join(directory, INDEX_FILE)
+
+def export_metadata(item, source: str, source_size, frame_size: int, profile_name: str) -> dict:
+    """
+    Index fields describing where an export came from (export_frame adds file, caption, size, time).
+    source is the path the original was queued from, the same for a first save and a re-save
+    (item.path may already point into processed/).
+    """
+    meta = {"source": source}
+    if item.is_frame:
+        meta["source_frame"] = item.frame
+    meta.update(source_size=list(source_size), frame_size=int(frame_size), profile=profile_name)
+    return meta
+
+def append_records(directory: str, records):
+    """
+    Append lines to the directory's index. They go out in a single O_APPEND write, so
+    concurrent writers (service threads, other instances on a local disk) never interleave.
+    The index is only ever appended to here; rewriting it is left to rebuild_index().
+    """
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    if not data:
+        return
+    flags = os.O_WRONLY | os.O_APPEND | os.O_CREAT | getattr(os, "O_BINARY", 0)
+    fd = os.open(index_path(directory), flags, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+def append_record(directory: str, record: dict):
+    append_records(directory, (record,))
+
+def mark_deleted(directory: str, file_name: str):
+    """Record that an exported file was removed (e.g. replaced by a re-save)."""
+    append_record(directory, {"file": file_name, "deleted": True})
+
+def read_index(directory: str):
+    """
+    Fold the log into {file name: record}: a full record replaces earlier ones for its file,
+    an "update" record (e.g. a new caption) is merged into it, and a deleted marker drops it.
+    """
+    records = {}
+    try:
+        f = open(index_path(directory), "r", encoding="utf-8")
+    except FileNotFoundError:
+        return records
+    with f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            name = rec.get("file") if isinstance(rec, dict) else None
+            if not name:
+                continue
+            if rec.get("deleted"):
+                records.pop(name, None)
+            elif rec.get("update"):
+                if name in records:
+                    records[name].update((k, v) for k, v in rec.items() if k != "update")
+            else:
+                records[name] = rec
+    return records
+
+def write_index(directory: str, records):
+    """Replace the index atomically with the given records (compacts the log)."""
+    atomic_write(index_path(directory), "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+
+def iter_export_pairs(directory: str):
+    """Yield (image name, caption path) for each exported image with a .txt of the same stem."""
+    captions = {}
+    images = {}
+    with os.scandir(directory) as it:
+        for entry in it:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            stem, ext = os.path.splitext(entry.name)
+            ext = ext.lower()
+            if ext == ".txt":
+                captions[stem] = entry.path
+            elif ext in IMAGE_EXTS:
+                images.setdefault(stem, entry.name)
+    for stem, path in captions.items():
+        if stem in images:
+            yield images[stem], path
+
+def update_captions(directory: str, captions_by_stem: dict) -> int:
+    """
+    Append caption "update" records for already indexed files (after a bulk re-caption);
+    returns the number appended. Nothing is rewritten, so concurrent appends are never lost.
+    """
+    if not captions_by_stem or not os.path.exists(index_path(directory)):
+        return 0
+    updates = []
+    for name, rec in read_index(directory).items():
+        caption = captions_by_stem.get(os.path.splitext(name)[0])
+        if caption is not None and rec.get("caption") != caption:
+            updates.append({"file": name, "caption": caption, "update": True})
+    append_records(directory, updates)
+    return len(updates)
+
+def _scan_pair(directory, image_name, txt_path):
+    try:
+        with open(txt_path, "r", encoding="utf-8") as f:
+            caption = f.read()
+        with Image.open(os.path.join(directory, image_name)) as im:  # header only
+            size = im.size
+        return image_name, caption, size, None
+    except Exception as e:
+        return image_name, None, None, str(e)
+
+def rebuild_index(directory: str, max_workers: int = REBUILD_WORKERS):
+    """
+    Rebuild the index from the image + .txt pairs in directory: captions and sizes come from
+    the files, while source / frame / profile / time are kept from the old index where the file
+    is still listed. Returns (records written, [(image name, error)]).
+    """
+    old = read_index(directory)
+    pairs = sorted(iter_export_pairs(directory))
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reindex") as pool:
+        scanned = list(pool.map(lambda p: _scan_pair(directory, *p), pairs))
+    records, errors = [], []
+    for name, caption, size, error in scanned:
+        if error is not None:
+            errors.append((name, error))
+            continue
+        rec = dict(old.get(name, {}))
+        rec.update(file=name, caption=caption, width=size[0], height=size[1])
+        records.append(rec)
+    write_index(directory, records)
+    return len(records), errors
@@ -0,0 +1,129 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from suggestions import parts_from_text
+from fsutil import atomic_write
+from metaindex import iter_export_pairs, update_captions, index_path
+
+RECAPTION_WORKERS = max(4, min(32, (os.cpu_count() or 4) * 2))  # I/O bound: oversubscribe
+SAMPLE_DIFFS = 20  # per-file before/after examples kept for the summary
+
+class CaptionRules:
+    """
+    Edits applied to one caption, in order: replace -> remove -> add -> move to front.
+    Parts are split and de-duplicated exactly like parts_from_text (first occurrence wins).
+    """
+    def __init__(self, add=(), remove=(), replace=None, front=()):
+        self.add = list(parts_from_text(", ".join(add)))
+        self.remove = set(parts_from_text(", ".join(remove)))
+        self.replace = dict(replace or {})
+        self.front = list(parts_from_text(", ".join(front)))
+
+    def is_empty(self) -> bool:
+        return not (self.add or self.remove or self.replace or self.front)
+
+    def apply_parts(self, parts):
+        parts = [self.replace.get(p, p) for p in parts]
+        parts = [p for p in parts if p not in self.remove]
+        parts = parts + [p for p in self.add if p not in self.remove]
+        parts = parts_from_text(", ".join(parts))  # de-duplicate, first seen wins
+        if self.front:
+            present = set(parts)
+            head = [p for p in self.front if p in present]
+            head_set = set(head)
+            parts = head + [p for p in parts if p not in head_set]
+        return parts
+
+    def apply(self, text: str) -> str:
+        return ", ".join(self.apply_parts(parts_from_text(text)))
+
+class RecaptionResult:
+    def __init__(self):
+        self.scanned = 0
+        self.changed = 0
+        self.errors = []         # (path, message)
+        self.added = Counter()   # part -> files it was added to
+        self.removed = Counter() # part -> files it was removed from
+        self.samples = []        # (path, old, new)
+
+    def summary(self, dry_run: bool) -> str:
+        verb = "would change" if dry_run else "changed"
+        lines = [f"{self.scanned} caption file(s) scanned, {verb} {self.changed}."]
+        if self.added:
+            lines.append("Added: " + ", ".join(f"{p} ({n})" for p, n in self.added.most_common(10)))
+        if self.removed:
+            lines.append("Removed: " + ", ".join(f"{p} ({n})" for p, n in self.removed.most_common(10)))
+        for path, old, new in self.samples[:5]:
+            lines.append(f"\n{os.path.basename(path)}\n  - {old}\n  + {new}")
+        if self.errors:
+            lines.append(f"\n{len(self.errors)} error(s), first: {self.errors[0][0]}: {self.errors[0][1]}")
+        return "\n".join(lines)
+
+def iter_caption_files(directory: str):
+    """Yield .txt paths in directory that sit next to an exported image with the same stem."""
+    for _image_name, path in iter_export_pairs(directory):
+        yield path
+
+def _process_file(path: str, rules: CaptionRules, dry_run: bool):
+    with open(path, "r", encoding="utf-8") as f:
+        old = f.read()
+    old_parts = parts_from_text(old)
+    new_parts = rules.apply_parts(old_parts)
+    new = ", ".join(new_parts)
+    if new == old:
+        return path, old, new, False, (), ()
+    if not dry_run:
+        # rename is still atomic for readers; skipping fsync keeps 100k small files fast
+        atomic_write(path, new, fsync=False)
+    before, after = set(old_parts), set(new_parts)
+    return path, old, new, True, tuple(after - before), tuple(before - after)
+
+def recaption_dirs(directories, rules: CaptionRules, dry_run: bool = True, max_workers: int = RECAPTION_WORKERS):
+    """
+    Apply rules to every caption file in the given output dirs on a thread pool.
+    Files are streamed from os.scandir with a bounded number of in-flight tasks.
+    Each folder's metadata index (if any) gets the new captions once its files are done.
+    """
+    result = RecaptionResult()
+    window = max_workers * 4
+    new_captions = {}  # directory -> {stem: new caption}
+
+    def collect(done):
+        for fut in done:
+            try:
+                path, old, new, changed, added, removed = fut.result()
+            except Exception as e:
+                result.errors.append((getattr(fut, "path", "?"), str(e)))
+                continue
+            result.scanned += 1
+            if changed:
+                result.changed += 1
+                result.added.update(added)
+                result.removed.update(removed)
+                if not dry_run:
+                    directory, name = os.path.split(path)
+                    new_captions.setdefault(directory, {})[os.path.splitext(name)[0]] = new
+                if len(result.samples) < SAMPLE_DIFFS:
+                    result.samples.append((path, old, new))
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="recaption") as pool:
+        in_flight = set()
+        for directory in dict.fromkeys(os.path.abspath(d) for d in directories):
+            if not os.path.isdir(directory):
+                continue
+            for path in iter_caption_files(directory):
+                fut = pool.submit(_process_file, path, rules, dry_run)
+                fut.path = path
+                in_flight.add(fut)
+                if len(in_flight) >= window:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    collect(done)
+        done, _ = wait(in_flight)
+        collect(done)
+    for directory, captions in new_captions.items():
+        try:
+            update_captions(directory, captions)
+        except Exception as e:
+            result.errors.append((index_path(directory), str(e)))
+    return result
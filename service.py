@@ -0,0 +1,318 @@
+import io
+import os
+import re
+import sys
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image
+
+from export import crop_to_frame, export_frame, record_stats
+from fsutil import NameIndexRegistry, move_unique
+from frames import expand_paths, open_item
+from metaindex import export_metadata
+from shards import ShardWriter
+from suggestions import parts_from_text
+
+PREVIEW_MAX = 1024          # default longest side of preview JPEGs
+PREVIEW_CACHE_ITEMS = 64    # previews kept in memory (LRU)
+SERVICE_WORKERS = max(2, min(8, (os.cpu_count() or 2)))
+MAX_BODY = 1024 * 1024      # bytes accepted in a POST body
+
+class AlreadyHandled(Exception):
+    """The queue item is already exported/skipped, or a request for it is still running."""
+
+class PreviewCache:
+    """Small thread-safe LRU of encoded preview JPEGs keyed by (path, frame, max_side)."""
+    def __init__(self, capacity: int = PREVIEW_CACHE_ITEMS):
+        self.capacity = capacity
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.capacity:
+                self._items.popitem(last=False)
+
+class CropService:
+    """
+    Server side of the thin-client mode: serves downscaled previews of the queue and
+    performs full-resolution crop + stages + encode + file moves on a worker pool.
+    Crop requests use ImageViewport's transform model relative to the frame:
+    full-resolution scale S and the image's top-left (dx, dy) measured from the frame's top-left.
+    """
+    def __init__(self, config, paths, global_words: str = "", max_workers: int = SERVICE_WORKERS):
+        self.config = config
+        self.items = expand_paths(paths)
+        self.origins = [item.path for item in self.items]  # where each file was queued from
+        self.done = [False] * len(self.items)
+        self._busy = set()  # indexes with a crop/skip in progress
+        self._moving = set()  # originals being moved to processed (outside the lock)
+        self.global_parts = parts_from_text(global_words)
+        self.names = NameIndexRegistry()
+        self.previews = PreviewCache()
+        self.shard_writers = {}
+        self._sizes = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="crop")
+
+    # ---- Queue ----
+    def _full_size(self, item):
+        size = self._sizes.get(item.path)
+        if size is None:
+            with Image.open(item.path) as im:  # header only
+                size = im.size
+            self._sizes[item.path] = size
+        return size
+
+    def queue_info(self):
+        items = []
+        with self._lock:
+            snapshot = list(enumerate(zip(self.items, self.done)))
+        for i, (item, done) in snapshot:
+            try:
+                w, h = self._full_size(item)
+            except Exception:
+                w = h = None
+            items.append({
+                "id": i, "name": item.label(), "frame": item.frame, "n_frames": item.n_frames,
+                "width": w, "height": h, "done": done,
+            })
+        return {
+            "frame_size": int(self.config.get("frame_size", 768)),
+            "export_profile": self.config.get("export_profile"),
+            "items": items,
+        }
+
+    def _item(self, idx: int):
+        with self._lock:
+            if not 0 <= idx < len(self.items):
+                raise KeyError(idx)
+            return self.items[idx]
+
+    # ---- Previews ----
+    def preview(self, idx: int, max_side: int = PREVIEW_MAX):
+        """Returns (jpeg bytes, scale) where scale = preview px per full-resolution px."""
+        item = self._item(idx)
+        key = (item.path, item.frame, max_side)
+        cached = self.previews.get(key)
+        if cached is None:
+            cached = self._pool.submit(self._render_preview, item, max_side).result()
+            self.previews.put(key, cached)
+        return cached
+
+    def _render_preview(self, item, max_side):
+        full_w, _ = self._full_size(item)
+        im = open_item(item)
+        im.draft("RGB", (max_side, max_side))  # JPEG: let the decoder downscale
+        im = im.convert("RGB")
+        im.thumbnail((max_side, max_side), Image.LANCZOS)
+        buf = io.BytesIO()
+        im.save(buf, format="JPEG", quality=85)
+        return buf.getvalue(), im.width / float(full_w)
+
+    # ---- Crop / skip ----
+    def _begin(self, idx: int):
+        """Mark idx in progress; a second crop/skip of the same item is refused, not repeated."""
+        with self._lock:
+            if not 0 <= idx < len(self.items):
+                raise KeyError(idx)
+            if self.done[idx] or idx in self._busy:
+                raise AlreadyHandled(f"item {idx} is already {'done' if self.done[idx] else 'in progress'}")
+            self._busy.add(idx)
+            return self.items[idx]
+
+    def _run(self, idx: int, fn, *args):
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            with self._lock:
+                self._busy.discard(idx)
+
+    def crop(self, idx: int, params: dict):
+        item = self._begin(idx)
+        return self._run(idx, self._crop, idx, item, params)
+
+    def _crop(self, idx, item, params):
+        S = float(params["S"])
+        dx = float(params["dx"])
+        dy = float(params["dy"])
+        frame = int(params.get("frame_size") or self.config.get("frame_size", 768))
+        if S <= 0 or not 16 <= frame <= 8192:
+            raise ValueError("invalid S or frame_size")
+
+        img = open_item(item).convert("RGBA")
+        out_img = crop_to_frame(img, S, dx, dy, frame)
+
+        notes = parts_from_text(params.get("caption", ""))
+        head = self.global_parts if params.get("use_global_words", True) else []
+        caption = ", ".join(dict.fromkeys(head + notes))
+
+        profile_name = params.get("profile") or self.config.get("export_profile")
+        profiles = self.config.get("export_profiles")
+        if profile_name not in profiles:
+            raise ValueError(f"unknown export profile: {profile_name}")
+        out_dir = self.config.effective_output_dir_for(self.origins[idx])
+        result = export_frame(
+            out_img, caption, self.names.get(out_dir), item.export_stem(), profiles[profile_name],
+            stages=self.config.get("process_stages") or [],
+            shard_writer=self._shard_writer_for(self.origins[idx]) if self.config.get("shard_export") else None,
+            metadata=export_metadata(item, self.origins[idx], img.size, frame, profile_name),
+        )
+        with self._lock:
+            record_stats(self.config.get("export_stats"), profile_name, result["seconds"], result["bytes"])
+        moved_to = self._finish(idx)
+        return {
+            "image": result["image_path"], "caption": result["txt_path"], "text": caption,
+            "size": list(result["size"]), "stages": result["stage_report"], "moved_to": moved_to,
+        }
+
+    def skip(self, idx: int):
+        self._begin(idx)
+        return {"moved_to": self._run(idx, self._finish, idx)}
+
+    def _finish(self, idx):
+        """Mark idx done; once every frame of its file is done, move the original to processed."""
+        with self._lock:
+            self.done[idx] = True
+            src = self.items[idx].path
+            if src in self._moving or not all(d for it, d in zip(self.items, self.done) if it.path == src):
+                return None
+            # Resolve from the queued location: once moved, src itself sits in processed/
+            proc_dir = self.config.effective_processed_dir_for(self.origins[idx])
+            if os.path.abspath(os.path.dirname(src)) == os.path.abspath(proc_dir):
+                return None
+            self._moving.add(src)
+        # Outside the lock: across filesystems this is a full copy, and other requests must not wait on it
+        try:
+            dest = move_unique(src, self.names.get(proc_dir))
+        finally:
+            with self._lock:
+                self._moving.discard(src)
+        with self._lock:
+            self.items = [it.with_path(dest) if it.path == src else it for it in self.items]
+            size = self._sizes.pop(src, None)
+            if size is not None:
+                self._sizes[dest] = size
+        return dest
+
+    def _shard_writer_for(self, src_path):
+        shard_dir = self.config.effective_shard_dir_for(src_path)
+        with self._lock:
+            writer = self.shard_writers.get(shard_dir)
+            if writer is None:
+                max_bytes = int(float(self.config.get("shard_max_mb", 1024)) * 1024 * 1024)
+                writer = ShardWriter(shard_dir, max_bytes)
+                self.shard_writers[shard_dir] = writer
+            return writer
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for writer in self.shard_writers.values():
+            try:
+                writer.close()
+            except Exception as e:
+                print(f"[shards] failed to close shard in {writer.directory}: {e}", file=sys.stderr)
+        self.config.save()
+
+_ROUTE = re.compile(r"^/(preview|crop|skip)/(\d+)$")
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = "LoraPrepareCropService/1.0"
+
+    @property
+    def service(self) -> CropService:
+        return self.server.service
+
+    def _send(self, code: int, body: bytes, content_type: str, headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, code: int, obj):
+        self._send(code, json.dumps(obj).encode("utf-8"), "application/json")
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            raise ValueError("request body too large")
+        raw = self.rfile.read(length) if length else b"{}"
+        data = json.loads(raw.decode("utf-8"))
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        return data
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        try:
+            if url.path in ("/", "/queue"):
+                self._json(200, self.service.queue_info())
+                return
+            m = _ROUTE.match(url.path)
+            if m and m.group(1) == "preview":
+                qs = parse_qs(url.query)
+                max_side = max(64, min(4096, int(qs.get("max", [PREVIEW_MAX])[0])))
+                data, scale = self.service.preview(int(m.group(2)), max_side)
+                self._send(200, data, "image/jpeg", {"X-Preview-Scale": f"{scale:.6f}"})
+                return
+            self._json(404, {"error": "not found"})
+        except KeyError:
+            self._json(404, {"error": "no such item"})
+        except Exception as e:
+            self._json(500, {"error": str(e)})
+
+    def do_POST(self):
+        m = _ROUTE.match(urlparse(self.path).path)
+        if not m or m.group(1) == "preview":
+            self._json(404, {"error": "not found"})
+            return
+        try:
+            idx = int(m.group(2))
+            if m.group(1) == "crop":
+                self._json(200, self.service.crop(idx, self._read_json()))
+            else:
+                self._json(200, self.service.skip(idx))
+        except AlreadyHandled as e:
+            self._json(409, {"error": str(e)})
+        except KeyError as e:
+            self._json(404 if e.args and isinstance(e.args[0], int) else 400, {"error": f"missing or unknown: {e}"})
+        except ValueError as e:
+            self._json(400, {"error": str(e)})
+        except Exception as e:
+            self._json(500, {"error": str(e)})
+
+def make_server(service: CropService, host: str = "127.0.0.1", port: int = 8765):
+    """Threaded HTTP server (one thread per request); CPU work goes to the service's pool."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+def serve(service: CropService, host: str = "127.0.0.1", port: int = 8765):
+    server = make_server(service, host, port)
+    print(f"Crop service on http://{server.server_address[0]}:{server.server_address[1]}/ "
+          f"({len(service.items)} queue item(s)); Ctrl+C to stop")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,91 @@
+import io
+import os
+import re
+import json
+import time
+import tarfile
+import threading
+
+SHARD_INDEX_FILE = "index.jsonl"     # one JSON line per finished shard
+SHARD_WRITE_BUFFER = 8 * 1024 * 1024  # large buffered writes keep shard I/O sequential
+
+def sample_key(stem: str) -> str:
+    """WebDataset splits member names on the first dot, so keys must not contain any."""
+    return re.sub(r"[.\s]+", "_", stem).strip("_") or "sample"
+
+class ShardWriter:
+    """
+    Streams samples (key + {ext: bytes}) into size-bounded WebDataset-style tar shards:
+    <prefix>-000000.tar, <prefix>-000001.tar, ...
+    The shard being written has a .tmp suffix and is renamed when closed, so any *.tar
+    in the folder is always complete. Each finished shard gets a line in index.jsonl.
+    """
+    def __init__(self, directory: str, max_bytes: int, prefix: str = "shard"):
+        self.directory = directory
+        self.max_bytes = max(1, int(max_bytes))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._file = None
+        self._tar = None
+        self._name = None
+        self._keys = []
+        os.makedirs(directory, exist_ok=True)
+        self._next_no = self._scan_next_number()
+
+    def _scan_next_number(self) -> int:
+        # A leftover .tar.tmp (crash while writing) keeps its number, so it is never reopened and truncated
+        pat = re.compile(rf"^{re.escape(self.prefix)}-(\d+)\.tar(?:\.tmp)?$")
+        last = -1
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                m = pat.match(entry.name)
+                if m:
+                    last = max(last, int(m.group(1)))
+        return last + 1
+
+    def _open_next(self):
+        self._name = f"{self.prefix}-{self._next_no:06d}.tar"
+        self._next_no += 1
+        self._file = open(os.path.join(self.directory, self._name + ".tmp"), "wb", buffering=SHARD_WRITE_BUFFER)
+        self._tar = tarfile.open(fileobj=self._file, mode="w", format=tarfile.PAX_FORMAT)
+        self._keys = []
+
+    def _close_current(self):
+        if self._tar is None:
+            return
+        self._tar.close()  # writes the end-of-archive blocks
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        size = self._file.tell()
+        self._file.close()
+        tmp = os.path.join(self.directory, self._name + ".tmp")
+        os.replace(tmp, os.path.join(self.directory, self._name))
+        record = {"shard": self._name, "count": len(self._keys), "bytes": size, "keys": self._keys}
+        with open(os.path.join(self.directory, SHARD_INDEX_FILE), "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        self._tar = self._file = self._name = None
+        self._keys = []
+
+    def write(self, key: str, files: dict):
+        """Append one sample, e.g. write("img_0001", {"jpg": b"...", "txt": b"..."})."""
+        key = sample_key(key)
+        payload = sum(len(b) for b in files.values())
+        with self._lock:
+            if self._tar is not None and self._keys and self._file.tell() + payload > self.max_bytes:
+                self._close_current()
+            if self._tar is None:
+                self._open_next()
+            now = time.time()
+            for ext, data in files.items():
+                if isinstance(data, str):
+                    data = data.encode("utf-8")
+                info = tarfile.TarInfo(f"{key}.{ext.lstrip('.')}")
+                info.size = len(data)
+                info.mtime = now
+                info.mode = 0o644
+                self._tar.addfile(info, io.BytesIO(data))
+            self._keys.append(key)
+
+    def close(self):
+        with self._lock:
+            self._close_current()
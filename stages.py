@@ -0,0 +1,119 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+# Rec. 601 luma weights
+_LUMA = np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+def _luma(a):
+    return a[..., :3].astype(np.float32) @ _LUMA
+
+def normalize_color(a):
+    """Gray-world white balance, then stretch the 0.5%..99.5% luma range to full scale."""
+    f = a.astype(np.float32)
+    means = f.reshape(-1, 3).mean(axis=0)
+    gain = means.mean() / np.maximum(means, 1.0)
+    f *= gain
+    # Percentiles from a 256-bin histogram: far cheaper than np.percentile's sort
+    hist = np.bincount(np.clip(f @ _LUMA, 0, 255).astype(np.uint8).ravel(), minlength=256)
+    cdf = np.cumsum(hist)
+    lo, hi = np.searchsorted(cdf, (0.005 * cdf[-1], 0.995 * cdf[-1]))
+    if hi - lo > 1.0:
+        f = (f - lo) * (255.0 / (hi - lo))
+    stats = {"gain": [round(float(g), 3) for g in gain], "levels": [round(float(lo), 1), round(float(hi), 1)]}
+    return np.clip(f, 0, 255).astype(np.uint8), stats
+
+def sharpen(a, amount: float = 0.4):
+    """Light unsharp mask using a 3x3 box blur built from shifted slices."""
+    f = a.astype(np.float32)
+    p = np.pad(f, ((1, 1), (1, 1), (0, 0)), mode="edge")
+    h, w = f.shape[:2]
+    blur = sum(p[y:y + h, x:x + w] for y in range(3) for x in range(3)) / 9.0
+    out = f + amount * (f - blur)
+    return np.clip(out, 0, 255).astype(np.uint8), {"amount": amount}
+
+def exposure_stats(a, low: int = 2, high: int = 253):
+    """Share of pixels crushed to black / blown to white (stats only, image unchanged)."""
+    y = _luma(a)
+    n = float(y.size)
+    stats = {
+        "clipped_low": round(float((y <= low).sum()) / n, 4),
+        "clipped_high": round(float((y >= high).sum()) / n, 4),
+        "mean": round(float(y.mean()), 1),
+    }
+    return None, stats
+
+def letterbox_detect(a, threshold: int = 16):
+    """Width in px of uniform dark borders on each side (stats only, image unchanged)."""
+    y = _luma(a)
+    dark_rows = y.max(axis=1) <= threshold
+    dark_cols = y.max(axis=0) <= threshold
+
+    def run_length(mask):
+        idx = np.flatnonzero(~mask)
+        return int(idx[0]) if idx.size else int(mask.size)
+
+    stats = {
+        "top": run_length(dark_rows),
+        "bottom": run_length(dark_rows[::-1]),
+        "left": run_length(dark_cols),
+        "right": run_length(dark_cols[::-1]),
+    }
+    return None, stats
+
+# name -> fn(array) returning (new array or None if unchanged, stats dict)
+STAGES = {
+    "normalize_color": normalize_color,
+    "sharpen": sharpen,
+    "exposure_stats": exposure_stats,
+    "letterbox_detect": letterbox_detect,
+}
+
+STAGE_LABELS = {
+    "normalize_color": "Normalize color",
+    "sharpen": "Light sharpen",
+    "exposure_stats": "Exposure stats",
+    "letterbox_detect": "Detect letterbox",
+}
+
+class StagePipeline:
+    """
+    Ordered post-crop stages run on the one in-memory frame, between crop and encode.
+    The frame is converted to a NumPy array once and back once, whatever the number of stages.
+    """
+    def __init__(self, names):
+        self.names = [n for n in names if n in STAGES]
+
+    def __bool__(self):
+        return bool(self.names)
+
+    def run(self, img):
+        """Returns (image, report) where report = {"timings": {stage: ms}, "stats": {stage: {...}}}."""
+        report = {"timings": {}, "stats": {}}
+        if not self.names:
+            return img, report
+        a = np.asarray(img.convert("RGB"))
+        changed = False
+        for name in self.names:
+            t0 = time.perf_counter()
+            out, stats = STAGES[name](a)
+            report["timings"][name] = round((time.perf_counter() - t0) * 1000.0, 2)
+            report["stats"][name] = stats
+            if out is not None:
+                a = out
+                changed = True
+        return (Image.fromarray(a, "RGB") if changed else img), report
+
+def report_summary(report) -> str:
+    """Short per-stage timing line plus the headline stats, for the sidebar."""
+    bits = [f"{STAGE_LABELS.get(n, n)} {ms:.0f} ms" for n, ms in report["timings"].items()]
+    stats = report["stats"]
+    if "exposure_stats" in stats:
+        s = stats["exposure_stats"]
+        bits.append(f"clipped {100 * (s['clipped_low'] + s['clipped_high']):.1f}%")
+    if "letterbox_detect" in stats:
+        s = stats["letterbox_detect"]
+        if any(s.values()):
+            bits.append(f"border T{s['top']} B{s['bottom']} L{s['left']} R{s['right']}")
+    return " · ".join(bits)
@@ -0,0 +1,71 @@
+import time
+
+from fsutil import atomic_write
+
+FLUSH_DELAY_MS = 2000      # quiet period before dirty state is written
+FLUSH_MAX_WAIT_MS = 10000  # ...but never later than this after the first unsaved change
+
+class StateStore:
+    """
+    Single place that persists the app's small state files (config, global words, history).
+    Callers mark a source dirty; all dirty sources are written together once nothing changed
+    for FLUSH_DELAY_MS, at the latest FLUSH_MAX_WAIT_MS after the first unsaved change (so steady
+    work faster than the delay still reaches disk), and immediately on flush() (e.g. when the window closes).
+    Writes are atomic and skipped when the serialized content did not change.
+    """
+    def __init__(self, tk_widget, delay_ms: int = FLUSH_DELAY_MS, max_wait_ms: int = FLUSH_MAX_WAIT_MS):
+        self._tk = tk_widget
+        self.delay_ms = delay_ms
+        self.max_wait_ms = max_wait_ms
+        self._sources = {}   # name -> (path, serialize callable returning str)
+        self._dirty = set()
+        self._written = {}   # name -> last content written (or read at startup)
+        self._after_id = None
+        self._first_dirty = None  # monotonic time of the oldest unflushed mark
+
+    def register(self, name: str, path: str, serialize, current=None):
+        """current: the content already on disk, if known, so an unchanged first flush is skipped."""
+        self._sources[name] = (path, serialize)
+        if current is not None:
+            self._written[name] = current
+
+    def forget(self, name: str):
+        """The file was removed behind our back; make the next flush write it unconditionally."""
+        self._written.pop(name, None)
+
+    def mark_dirty(self, name: str):
+        self._dirty.add(name)
+        now = time.monotonic()
+        if self._first_dirty is None:
+            self._first_dirty = now
+        if self._after_id is not None:
+            try:
+                self._tk.after_cancel(self._after_id)
+            except Exception:
+                pass
+        left_ms = self.max_wait_ms - (now - self._first_dirty) * 1000
+        self._after_id = self._tk.after(max(0, int(min(self.delay_ms, left_ms))), self._on_timer)
+
+    def _on_timer(self):
+        self._after_id = None
+        self.flush()
+
+    def flush(self):
+        if self._after_id is not None:
+            try:
+                self._tk.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        self._first_dirty = None
+        dirty, self._dirty = self._dirty, set()
+        for name in dirty:
+            path, serialize = self._sources[name]
+            try:
+                content = serialize()
+                if self._written.get(name) == content:
+                    continue
+                atomic_write(path, content)
+                self._written[name] = content
+            except Exception:
+                pass
@@ -1,7 +1,15 @@
 import os
+import heapq
 
 # threshold at which a word/part appears as a suggestion
 SUGGEST_THRESHOLD = 2  # >= 2 uses
+DISPLAY_LIMIT = 120    # suggestions shown in the grid (the most used ones)
+
+# Bounded history: counts decay so stale tags fade, and the least used tags are evicted
+DEFAULT_CAPACITY = 2000  # max tags kept
+DECAY_EVERY = 200        # decay all counts after this many processed captions
+DECAY_FACTOR = 0.9       # multiplier applied at each decay step
+FORGET_BELOW = 0.5       # decayed counts below this are dropped
 
 def parts_from_text(raw_text: str):
     """
@@ -23,11 +31,25 @@ def parts_from_text(raw_text: str):
 class SuggestionStore:
     """
     Keeps frequency counts for parts; persists semicolon-separated file:
-    <part>;<count> per line. Renders suggestions alphabetically.
+    <part>;<count>;<last use> per line. Renders suggestions alphabetically.
+    The store never writes its file itself: dumps() serializes it and the app's StateStore
+    persists that (debounced, atomic).
+
+    The store is bounded: every DECAY_EVERY captions all counts are multiplied by
+    DECAY_FACTOR, and above capacity the least frequently (then least recently) used
+    parts are evicted. The top DISPLAY_LIMIT parts are maintained incrementally.
     """
-    def __init__(self, path: str):
+    def __init__(self, path: str, capacity: int = DEFAULT_CAPACITY,
+                 decay_every: int = DECAY_EVERY, decay_factor: float = DECAY_FACTOR):
         self.path = path
-        self.counts = {}  # part -> int
+        self.capacity = max(DISPLAY_LIMIT, int(capacity))
+        self.decay_every = max(1, int(decay_every))
+        self.decay_factor = float(decay_factor)
+        self.counts = {}     # part -> float (decayed use count)
+        self.last_used = {}  # part -> tick of last use
+        self.tick = 0        # number of captions processed
+        self._top = set()    # parts shown as suggestions (count >= threshold, highest counts)
+        self._top_min = None # cached lowest-count member of _top, None = recompute
         self.load()
 
     def load(self):
@@ -37,34 +59,106 @@ class SuggestionStore:
                     line = line.strip()
                     if not line or ";" not in line:
                         continue
-                    tag, cnt = line.split(";", 1)
+                    fields = line.rsplit(";", 2)
                     try:
-                        c = int(cnt)
-                        self.counts[tag] = max(self.counts.get(tag, 0), c)
-                    except ValueError:
-                        pass
+                        tag, cnt, last = fields[0], float(fields[1]), int(fields[2])
+                    except (IndexError, ValueError):
+                        tag, cnt = line.split(";", 1)  # old <part>;<count> format
+                        last = 0
+                        try:
+                            cnt = float(cnt)
+                        except ValueError:
+                            continue
+                    if cnt > self.counts.get(tag, 0):
+                        self.counts[tag] = cnt
+                        self.last_used[tag] = last
+                    self.tick = max(self.tick, last)
         except FileNotFoundError:
             self.counts = {}
         except Exception:
             pass
-        self.save_alpha()  # keep alpha on disk
+        self._evict()
+        self._rebuild_top()
 
-    def save_alpha(self):
-        try:
-            items = sorted(self.counts.items(), key=lambda t: t[0].lower())
-            with open(self.path, "w", encoding="utf-8") as f:
-                for tag, cnt in items:
-                    f.write(f"{tag};{cnt}\n")
-        except Exception:
-            pass
+    def dumps(self) -> str:
+        items = sorted(self.counts.items(), key=lambda t: t[0].lower())
+        return "".join(f"{tag};{round(cnt, 2):g};{self.last_used.get(tag, 0)}\n" for tag, cnt in items)
 
     def process_text_for_counts(self, raw_text: str):
-        for p in parts_from_text(raw_text):
+        parts = parts_from_text(raw_text)
+        if not parts:
+            return
+        self.tick += 1
+        for p in parts:
             self.counts[p] = self.counts.get(p, 0) + 1
-        self.save_alpha()
+            self.last_used[p] = self.tick
+            self._touch_top(p)
+        if self.tick % self.decay_every == 0:
+            self._decay()
+        if len(self.counts) > self.capacity:
+            self._evict()
+
+    # ---- Bounding ----
+    def _decay(self):
+        for p in list(self.counts):
+            c = self.counts[p] * self.decay_factor
+            if c < FORGET_BELOW:
+                self._drop(p)
+            else:
+                self.counts[p] = c
+        self._rebuild_top()  # uniform scaling keeps the order, but parts may fall below threshold
+
+    def _evict(self):
+        """LFU eviction down to 90% of capacity (batched, so it runs rarely)."""
+        if len(self.counts) <= self.capacity:
+            return
+        excess = len(self.counts) - int(self.capacity * 0.9)
+        victims = heapq.nsmallest(excess, self.counts, key=lambda p: (self.counts[p], self.last_used.get(p, 0)))
+        for p in victims:
+            self._drop(p)
+
+    def _drop(self, p):
+        self.counts.pop(p, None)
+        self.last_used.pop(p, None)
+        if p in self._top:
+            self._top.discard(p)
+            self._top_min = None
+
+    # ---- Incremental top-K ----
+    def _rebuild_top(self):
+        eligible = [p for p, c in self.counts.items() if c >= SUGGEST_THRESHOLD]
+        self._top = set(heapq.nlargest(DISPLAY_LIMIT, eligible, key=self.counts.__getitem__))
+        self._top_min = None
+
+    def _min_top(self):
+        if self._top_min is None or self._top_min not in self._top:
+            self._top_min = min(self._top, key=self.counts.__getitem__) if self._top else None
+        return self._top_min
+
+    def _touch_top(self, p):
+        """Called after p's count went up; O(1) unless the top set changes (then O(K))."""
+        if self.counts[p] < SUGGEST_THRESHOLD:
+            return
+        if p in self._top:
+            if p == self._top_min:
+                self._top_min = None
+            return
+        if len(self._top) < DISPLAY_LIMIT:
+            self._top.add(p)
+            self._top_min = None
+            return
+        m = self._min_top()
+        if self.counts[p] > self.counts[m]:
+            self._top.discard(m)
+            self._top.add(p)
+            self._top_min = None
 
     def clear(self):
         self.counts.clear()
+        self.last_used.clear()
+        self.tick = 0
+        self._top = set()
+        self._top_min = None
         try:
             if os.path.exists(self.path):
                 os.remove(self.path)
@@ -72,7 +166,7 @@ class SuggestionStore:
             pass
 
     def suggestions_alpha(self):
-        """Return [(part, count)] for parts with count >= threshold, alphabetically sorted."""
-        items = [(p, c) for p, c in self.counts.items() if c >= SUGGEST_THRESHOLD]
+        """Return [(part, count)] for the top DISPLAY_LIMIT parts with count >= threshold, alphabetically sorted."""
+        items = [(p, self.counts[p]) for p in self._top]
         items.sort(key=lambda t: t[0].lower())
         return items
@@ -0,0 +1,171 @@
+import os
+import json
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from fsutil import atomic_write
+
+BLUR_THRESHOLD = 100.0   # Laplacian variance below this counts as blurry
+BLUR_SAMPLE_SIZE = 512   # longest side (px) of the reduced decode used for blur scoring
+TRIAGE_WORKERS = max(2, min(8, (os.cpu_count() or 2)))
+
+def read_dimensions(path: str):
+    """Return (width, height) from the file header only; Image.open is lazy, no pixels are decoded."""
+    with Image.open(path) as im:
+        return im.size
+
+def blur_score(path: str) -> float:
+    """
+    Variance of the Laplacian on a reduced grayscale decode.
+    Higher means sharper. JPEGs use draft mode so the decoder itself downsamples.
+    """
+    with Image.open(path) as im:
+        im.draft("L", (BLUR_SAMPLE_SIZE, BLUR_SAMPLE_SIZE))
+        gray = im.convert("L")
+    gray.thumbnail((BLUR_SAMPLE_SIZE, BLUR_SAMPLE_SIZE))
+    a = np.asarray(gray, dtype=np.float32)
+    if a.shape[0] < 3 or a.shape[1] < 3:
+        return 0.0
+    lap = a[:-2, 1:-1] + a[2:, 1:-1] + a[1:-1, :-2] + a[1:-1, 2:] - 4.0 * a[1:-1, 1:-1]
+    return float(lap.var())
+
+def triage_file(path: str):
+    """Return {"w", "h", "blur"} for one file, or None if it cannot be read."""
+    try:
+        w, h = read_dimensions(path)
+        return {"w": int(w), "h": int(h), "blur": round(blur_score(path), 2)}
+    except Exception:
+        return None
+
+def is_low_res(result, frame_size: int) -> bool:
+    """True if the image cannot cover the square frame without upscaling."""
+    return result is not None and min(result["w"], result["h"]) < frame_size
+
+def is_blurry(result, threshold: float = BLUR_THRESHOLD) -> bool:
+    return result is not None and result["blur"] < threshold
+
+class TriageCache:
+    """
+    Per-file triage results keyed by absolute path and validated against (mtime_ns, size).
+    Persisted as JSON so re-opening the same folder does not re-score anything.
+    Entries for files that are gone are dropped when they are next looked up (a run stats its own
+    files anyway), so saving never walks the whole cache with a stat per entry.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = {}  # abs path -> {"mtime": int, "size": int, "result": dict}
+        self._lock = threading.Lock()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if isinstance(data, dict):
+                self.entries = data
+        except Exception:
+            pass
+
+    def save(self):
+        with self._lock:
+            if not self.dirty:
+                return
+            data = dict(self.entries)
+            self.dirty = False
+        try:
+            atomic_write(self.path, json.dumps(data))
+        except Exception:
+            pass
+
+    @staticmethod
+    def _stamp(path: str):
+        st = os.stat(path)
+        return st.st_mtime_ns, st.st_size
+
+    def get(self, path: str):
+        try:
+            mtime, size = self._stamp(path)
+        except OSError:
+            with self._lock:
+                if self.entries.pop(path, None) is not None:
+                    self.dirty = True
+            return None
+        with self._lock:
+            e = self.entries.get(path)
+        if e and e.get("mtime") == mtime and e.get("size") == size:
+            return e.get("result")
+        return None
+
+    def put(self, path: str, result):
+        try:
+            mtime, size = self._stamp(path)
+        except OSError:
+            return
+        with self._lock:
+            self.entries[path] = {"mtime": mtime, "size": size, "result": result}
+            self.dirty = True
+
+class TriageRunner:
+    """
+    Scores a list of files on a thread pool. Results are pushed onto a queue that the
+    UI drains from the Tk thread (Tk is not thread-safe, so workers never touch widgets).
+    Starting a new run invalidates the previous one.
+    """
+    def __init__(self, cache: TriageCache, max_workers: int = TRIAGE_WORKERS):
+        self.cache = cache
+        self.results = {}  # path -> result (None for unreadable files)
+        self.done = queue.Queue()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="triage")
+        self._generation = 0
+        self.pending = 0
+
+    def start(self, paths):
+        self._generation += 1
+        gen = self._generation
+        self.pending = 0
+        for p in paths:
+            cached = self.cache.get(p)
+            if cached is not None:
+                self.results[p] = cached
+                continue
+            self.pending += 1
+            self._pool.submit(self._work, gen, p)
+
+    def _work(self, gen, path):
+        if gen != self._generation:
+            return
+        result = triage_file(path)
+        if result is not None:
+            self.cache.put(path, result)
+        self.done.put((gen, path, result))
+
+    def drain(self):
+        """Collect finished results (call from the UI thread). Returns number of new results."""
+        n = 0
+        while True:
+            try:
+                gen, path, result = self.done.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self._generation:
+                continue
+            self.results[path] = result
+            self.pending = max(0, self.pending - 1)
+            n += 1
+        return n
+
+    def get(self, path: str):
+        return self.results.get(path)
+
+    def rename(self, old: str, new: str):
+        if old in self.results:
+            self.results[new] = self.results.pop(old)
+
+    def shutdown(self):
+        self._generation += 1
+        self._pool.shutdown(wait=False)
@@ -3,32 +3,47 @@ import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 
+from export import crop_to_frame
+
 ZOOM_STEP = 1.12
 MIN_SCALE = 0.02
 MAX_SCALE = 30.0
 SNAP_TOL = 10  # px; snap to frame edges while mouse-dragging
+CANVAS_BG = "#111"
+CANVAS_BG_RGB = (17, 17, 17)
+DIM_ALPHA = 128  # 50% black outside the frame when the dimming is baked into the buffer
 
 class ImageViewport(ttk.Frame):
     """
     Canvas viewport that displays an image with zoom/pan and a square frame overlay.
     Provides get_crop_result_rgb() to render the frame area as an RGB square image.
+
+    Rendering reuses one canvas-sized RGB buffer and one PhotoImage (re-created only when
+    the canvas is resized): each render resamples just the visible part of the image into
+    the buffer and pastes it into the PhotoImage in place. With bake_dim, the 50% dimming
+    outside the frame is composited into the buffer instead of drawn as stipple rectangles.
     """
-    def __init__(self, master, frame_size_getter, no_image_click_callback=None):
+    def __init__(self, master, frame_size_getter, no_image_click_callback=None, bake_dim=True):
         super().__init__(master)
         self.get_frame_size = frame_size_getter
         self.no_image_click_callback = no_image_click_callback
+        self.bake_dim = bake_dim
 
-        self.canvas = tk.Canvas(self, bg="#111", highlightthickness=0)
+        self.canvas = tk.Canvas(self, bg=CANVAS_BG, highlightthickness=0)
         self.canvas.grid(row=0, column=0, sticky="nsew")
         self.rowconfigure(0, weight=1)
         self.columnconfigure(0, weight=1)
 
         # Image state
         self.img_pil = None
-        self.img_disp = None
         self.tk_img = None
         self.img_id = None
 
+        # Reusable render buffers (sized to the canvas)
+        self._buf = None
+        self._dim_mask = None
+        self._dim_key = None
+
         # Transform (scale + translation)
         self.S = 1.0
         self.dx = 0.0
@@ -94,8 +109,8 @@ class ImageViewport(ttk.Frame):
 
     def clear(self):
         self.img_pil = None
-        self.img_disp = None
         self.tk_img = None
+        self._buf = None
         if self.img_id is not None:
             self.canvas.delete(self.img_id)
             self.img_id = None
@@ -148,54 +163,70 @@ class ImageViewport(ttk.Frame):
         """Return an RGB square image of size (frame, frame) from the frame area (letterbox black)."""
         if self.img_pil is None:
             return None
-        frame = self.get_frame_size()
-        L, T, R, B = self._frame_rect()
+        L, T, _, _ = self._frame_rect()
+        return crop_to_frame(self.img_pil, self.S, self.dx - L, self.dy - T, self.get_frame_size())
 
-        left_img   = (L - self.dx) / self.S
-        top_img    = (T - self.dy) / self.S
-        right_img  = (R - self.dx) / self.S
-        bottom_img = (B - self.dy) / self.S
+    def frame_transform(self):
+        """Current transform relative to the frame: (S, dx, dy, frame) as used by crop_to_frame."""
+        L, T, _, _ = self._frame_rect()
+        return self.S, self.dx - L, self.dy - T, self.get_frame_size()
 
-        iw, ih = self.img_pil.size
-        inter_left   = max(0, left_img)
-        inter_top    = max(0, top_img)
-        inter_right  = min(iw, right_img)
-        inter_bottom = min(ih, bottom_img)
-
-        out = Image.new("RGB", (frame, frame), (0, 0, 0))
-        if inter_right > inter_left and inter_bottom > inter_top:
-            crop = self.img_pil.crop((
-                int(inter_left), int(inter_top), int(inter_right), int(inter_bottom)
-            )).convert("RGB")
-
-            interL_canvas = inter_left * self.S + self.dx
-            interT_canvas = inter_top  * self.S + self.dy
-            dest_x = int(round(interL_canvas - L))
-            dest_y = int(round(interT_canvas - T))
-
-            inter_w_canvas = (inter_right - inter_left) * self.S
-            inter_h_canvas = (inter_bottom - inter_top) * self.S
-            target_w = max(1, int(round(inter_w_canvas)))
-            target_h = max(1, int(round(inter_h_canvas)))
-            if crop.size != (target_w, target_h):
-                crop = crop.resize((target_w, target_h), Image.LANCZOS)
-
-            out.paste(crop, (dest_x, dest_y))
-        return out
+    def set_frame_transform(self, S, dx, dy):
+        """Restore a transform returned by frame_transform() (same frame size assumed)."""
+        if self.img_pil is None:
+            return
+        L, T, _, _ = self._frame_rect()
+        self.S = max(MIN_SCALE, min(MAX_SCALE, float(S)))
+        self.dx = L + float(dx)
+        self.dy = T + float(dy)
+        self._render_image()
 
     # ---- Internals ----
+    def _ensure_buffers(self, cw, ch):
+        """(Re)allocate the RGB buffer and PhotoImage only when the canvas size changes."""
+        if self._buf is None or self._buf.size != (cw, ch):
+            self._buf = Image.new("RGB", (cw, ch), CANVAS_BG_RGB)
+            self.tk_img = ImageTk.PhotoImage("RGB", (cw, ch))
+            if self.img_id is not None:
+                self.canvas.itemconfigure(self.img_id, image=self.tk_img)
+
+    def _get_dim_mask(self, cw, ch):
+        """L mask: DIM_ALPHA outside the frame, 0 inside (cached per canvas/frame size)."""
+        key = (cw, ch, self.get_frame_size())
+        if self._dim_key != key:
+            L, T, R, B = (int(round(v)) for v in self._frame_rect_for(cw, ch))
+            mask = Image.new("L", (cw, ch), DIM_ALPHA)
+            mask.paste(0, (L, T, R, B))
+            self._dim_mask, self._dim_key = mask, key
+        return self._dim_mask
+
     def _render_image(self):
         if self.img_pil is None:
             return
-        disp_w = max(1, int(round(self.img_pil.width * self.S)))
-        disp_h = max(1, int(round(self.img_pil.height * self.S)))
-        self.img_disp = self.img_pil.resize((disp_w, disp_h), Image.LANCZOS)
-        self.tk_img = ImageTk.PhotoImage(self.img_disp)
+        cw, ch = self._canvas_size()
+        self._ensure_buffers(cw, ch)
+        buf = self._buf
+        buf.paste(CANVAS_BG_RGB, (0, 0, cw, ch))
+
+        # Visible part of the scaled image, in canvas px
+        iw, ih = self.img_pil.size
+        x0, y0 = max(0.0, self.dx), max(0.0, self.dy)
+        x1, y1 = min(float(cw), self.dx + iw * self.S), min(float(ch), self.dy + ih * self.S)
+        tx, ty = int(round(x0)), int(round(y0))
+        tw, th = int(round(x1)) - tx, int(round(y1)) - ty
+        if tw > 0 and th > 0:
+            # Resample only the source box that lands on screen
+            box = ((x0 - self.dx) / self.S, (y0 - self.dy) / self.S,
+                   (x1 - self.dx) / self.S, (y1 - self.dy) / self.S)
+            region = self.img_pil.resize((tw, th), Image.LANCZOS, box=box)
+            buf.paste(region, (tx, ty), region)  # alpha-composite over the background
+
+        if self.bake_dim:
+            buf.paste((0, 0, 0), (0, 0, cw, ch), self._get_dim_mask(cw, ch))
+
+        self.tk_img.paste(buf)
         if self.img_id is None:
-            self.img_id = self.canvas.create_image(self.dx, self.dy, image=self.tk_img, anchor="nw", tags="image")
-        else:
-            self.canvas.itemconfigure(self.img_id, image=self.tk_img)
-            self.canvas.coords(self.img_id, self.dx, self.dy)
+            self.img_id = self.canvas.create_image(0, 0, image=self.tk_img, anchor="nw", tags="image")
         for oid in self.overlay_ids:
             self.canvas.tag_raise(oid)
 
@@ -209,11 +240,12 @@ class ImageViewport(ttk.Frame):
         L, T, R, B = self._frame_rect()
         cw, ch = self._canvas_size()
 
-        # Dim outside frame (stipple ≈ 50% opacity)
-        self.overlay_ids.append(self.canvas.create_rectangle(0, 0, cw, T, fill="#000", outline="", stipple="gray50"))
-        self.overlay_ids.append(self.canvas.create_rectangle(0, T, L, B, fill="#000", outline="", stipple="gray50"))
-        self.overlay_ids.append(self.canvas.create_rectangle(R, T, cw, B, fill="#000", outline="", stipple="gray50"))
-        self.overlay_ids.append(self.canvas.create_rectangle(0, B, cw, ch, fill="#000", outline="", stipple="gray50"))
+        # Dim outside frame (stipple ≈ 50% opacity) unless it is baked into the render buffer
+        if not self.bake_dim:
+            self.overlay_ids.append(self.canvas.create_rectangle(0, 0, cw, T, fill="#000", outline="", stipple="gray50"))
+            self.overlay_ids.append(self.canvas.create_rectangle(0, T, L, B, fill="#000", outline="", stipple="gray50"))
+            self.overlay_ids.append(self.canvas.create_rectangle(R, T, cw, B, fill="#000", outline="", stipple="gray50"))
+            self.overlay_ids.append(self.canvas.create_rectangle(0, B, cw, ch, fill="#000", outline="", stipple="gray50"))
 
         # Frame outline + ticks
         self.overlay_ids.append(self.canvas.create_rectangle(L, T, R, B, outline="#6aa3ff", width=2))
@@ -249,15 +281,25 @@ class ImageViewport(ttk.Frame):
     def _on_release(self, _):
         self._dragging = False
 
+    @staticmethod
+    def wheel_sequences():
+        """Tk event sequences that carry mouse-wheel input on this platform."""
+        if sys.platform.startswith("linux"):
+            return ("<Button-4>", "<Button-5>")
+        return ("<MouseWheel>",)
+
+    @staticmethod
+    def wheel_steps(event):
+        """Signed wheel notches for a wheel event (X11 buttons, macOS deltas, Windows 120-unit deltas)."""
+        if sys.platform.startswith("linux"):
+            return 1 if event.num == 4 else -1
+        if sys.platform == "darwin":
+            return 1 if event.delta > 0 else -1
+        return event.delta / 120.0
+
     def _bind_wheel_events(self):
-        plat = sys.platform
-        if plat == "darwin":
-            self.canvas.bind("<MouseWheel>", self._on_wheel_darwin)
-        elif plat.startswith("linux"):
-            self.canvas.bind("<Button-4>", lambda e: self._on_wheel_linux(+1, e))
-            self.canvas.bind("<Button-5>", lambda e: self._on_wheel_linux(-1, e))
-        else:
-            self.canvas.bind("<MouseWheel>", self._on_wheel_windows)
+        for seq in self.wheel_sequences():
+            self.canvas.bind(seq, self._on_wheel)
 
     def _ctrl_held(self, event):
         return (event.state & 0x0004) != 0
@@ -277,28 +319,14 @@ class ImageViewport(ttk.Frame):
         self.dy = cy - v * self.S
         self._render_image()
 
-    def _on_wheel_windows(self, event):
-        if self.img_pil is None:
-            return
-        steps = event.delta / 120.0
-        if steps == 0:
-            return
-        base = ZOOM_STEP ** (0.25 if self._ctrl_held(event) else 1.0)
-        self.zoom_at(event.x, event.y, base ** steps)
-
-    def _on_wheel_darwin(self, event):
-        if self.img_pil is None:
-            return
-        steps = 1 if event.delta > 0 else -1
-        base = ZOOM_STEP ** (0.25 if self._ctrl_held(event) else 1.0)
-        self.zoom_at(event.x, event.y, base ** steps)
+    def _on_wheel(self, event):
+        self.zoom_steps(event.x, event.y, self.wheel_steps(event), fine=self._ctrl_held(event))
 
-    def _on_wheel_linux(self, direction, event):
-        if self.img_pil is None:
+    def zoom_steps(self, cx, cy, steps, fine=False):
+        if self.img_pil is None or steps == 0:
             return
-        steps = direction
-        base = ZOOM_STEP ** (0.25 if self._ctrl_held(event) else 1.0)
-        self.zoom_at(event.x, event.y, base ** steps)
+        base = ZOOM_STEP ** (0.25 if fine else 1.0)
+        self.zoom_at(cx, cy, base ** steps)
 
     def _on_configure(self, event):
         new_cw, new_ch = int(event.width), int(event.height)
@@ -0,0 +1,223 @@
+import sys
+import json
+import math
+import time
+from types import SimpleNamespace
+
+from PIL import Image
+
+from fsutil import atomic_write
+
+TRACE_VERSION = 1
+FRAME_BUDGET_MS = 1000.0 / 60.0  # one 60 Hz frame
+
+_NUDGES = {"<Left>": (-1, 0), "<Right>": (1, 0), "<Up>": (0, -1), "<Down>": (0, 1)}
+
+class TraceRecorder:
+    """
+    Logs the input stream that reaches an ImageViewport, with timestamps relative to start:
+    press / drag / release, wheel (as platform-neutral signed steps), configure, arrow-key nudges,
+    plus image loads and frame-size changes so a replay reproduces the same transforms.
+    Bindings are added with add="+" after the app's own, so recording does not change behaviour.
+    """
+    def __init__(self, viewport):
+        self.viewport = viewport
+        self.events = []
+        self._t0 = time.perf_counter()
+        self._frame_size = None
+        self._initial_frame_size = None
+        self._attach()
+
+    def _attach(self):
+        vp = self.viewport
+        c = vp.canvas
+        c.bind("<ButtonPress-1>", lambda e: self._record("press", x=e.x, y=e.y), add="+")
+        c.bind("<B1-Motion>", lambda e: self._record("drag", x=e.x, y=e.y), add="+")
+        c.bind("<ButtonRelease-1>", lambda e: self._record("release", x=e.x, y=e.y), add="+")
+        c.bind("<Configure>", lambda e: self._record("configure", width=int(e.width), height=int(e.height)), add="+")
+        for seq in vp.wheel_sequences():
+            c.bind(seq, lambda e: self._record(
+                "wheel", x=e.x, y=e.y, steps=vp.wheel_steps(e), fine=vp._ctrl_held(e)), add="+")
+        for seq, (dx, dy) in _NUDGES.items():
+            c.bind(seq, lambda e, dx=dx, dy=dy: self._record("nudge", dx=dx, dy=dy), add="+")
+
+        set_image = vp.set_image
+
+        def recording_set_image(pil_image):
+            if pil_image is None:
+                self._record("clear")
+            else:
+                self._record("load", size=list(pil_image.size))
+            return set_image(pil_image)
+
+        vp.set_image = recording_set_image
+
+    def _record(self, kind, **fields):
+        frame = int(self.viewport.get_frame_size())
+        if frame != self._frame_size:
+            self._frame_size = frame
+            if self._initial_frame_size is None:
+                self._initial_frame_size = frame
+            else:
+                self.events.append({"t": self._now(), "type": "frame", "size": frame})
+        self.events.append({"t": self._now(), "type": kind, **fields})
+
+    def _now(self):
+        return round(time.perf_counter() - self._t0, 4)
+
+    def header(self):
+        return {"trace": TRACE_VERSION, "platform": sys.platform,
+                "frame_size": self._initial_frame_size, "events": len(self.events)}
+
+    def save(self, path: str):
+        """One JSON object per line: a header, then the events in order."""
+        lines = [json.dumps(self.header())] + [json.dumps(e) for e in self.events]
+        atomic_write(path, "\n".join(lines) + "\n")
+
+def load_trace(path: str):
+    """Returns (header, events)."""
+    with open(path, "r", encoding="utf-8") as f:
+        rows = [json.loads(line) for line in f if line.strip()]
+    if not rows or rows[0].get("trace") != TRACE_VERSION:
+        raise ValueError(f"{path}: not a viewport trace (version {TRACE_VERSION})")
+    return rows[0], rows[1:]
+
+def _synthetic_image(size):
+    """Noise image of the recorded size: same transforms as the original, no decode cost."""
+    return Image.effect_noise(tuple(size), 64).convert("RGB")
+
+class TraceReplayer:
+    """
+    Feeds a recorded trace into a live ImageViewport and times each event: the handler
+    call plus update_idletasks(), i.e. until Tk has redrawn the canvas.
+    With realtime pacing, events are issued at their recorded offsets (scaled by speed);
+    an event whose handling overruns FRAME_BUDGET_MS drops ceil(ms / budget) - 1 frames,
+    and an event that could only start more than one budget after its due time is counted late.
+    """
+    def __init__(self, root, viewport, frame_size: int, image=None):
+        self.root = root
+        self.viewport = viewport
+        self.image = image
+        self.frame_size = frame_size  # the replay viewport's frame_size_getter reads this
+        self._images = {}
+
+    def _load(self, size):
+        if self.image is not None:
+            return self.image
+        key = tuple(size)
+        if key not in self._images:
+            self._images[key] = _synthetic_image(key)
+        return self._images[key]
+
+    def _dispatch(self, ev):
+        vp = self.viewport
+        kind = ev["type"]
+        e = SimpleNamespace(x=ev.get("x", 0), y=ev.get("y", 0), state=0)
+        if kind == "press":
+            vp._on_press(e)
+        elif kind == "drag":
+            vp._on_drag(e)
+        elif kind == "release":
+            vp._on_release(e)
+        elif kind == "wheel":
+            vp.zoom_steps(e.x, e.y, ev["steps"], fine=ev.get("fine", False))
+        elif kind == "nudge":
+            vp.move_image(ev["dx"], ev["dy"])
+        elif kind == "configure":
+            # Resize for real so winfo sizes match; Tk delivers <Configure> to the viewport
+            self.root.geometry(f"{ev['width']}x{ev['height']}")
+            self.root.update()
+        elif kind == "load":
+            vp.set_image(self._load(ev["size"]))
+        elif kind == "clear":
+            vp.clear()
+        elif kind == "frame":
+            self.frame_size = int(ev["size"])
+            vp._redraw()
+        else:
+            return False
+        return True
+
+    def run(self, events, realtime: bool = True, speed: float = 1.0):
+        """Replay events; returns a report dict (see summarize)."""
+        samples = []
+        late = 0
+        budget_s = FRAME_BUDGET_MS / 1000.0
+        start = time.perf_counter()
+        for ev in events:
+            if realtime:
+                due = start + ev["t"] / speed
+                now = time.perf_counter()
+                if now < due:
+                    time.sleep(due - now)
+                elif now - due > budget_s:
+                    late += 1
+            t0 = time.perf_counter()
+            if not self._dispatch(ev):
+                continue
+            self.root.update_idletasks()
+            samples.append((ev["type"], (time.perf_counter() - t0) * 1000.0))
+        report = summarize(samples)
+        report["late_events"] = late if realtime else None
+        report["wall_s"] = round(time.perf_counter() - start, 3)
+        return report
+
+def _percentile(sorted_ms, q):
+    if not sorted_ms:
+        return 0.0
+    return sorted_ms[min(len(sorted_ms) - 1, int(round(q * (len(sorted_ms) - 1))))]
+
+def _stats(values):
+    v = sorted(values)
+    return {
+        "n": len(v),
+        "mean_ms": round(sum(v) / len(v), 2) if v else 0.0,
+        "p50_ms": round(_percentile(v, 0.50), 2),
+        "p95_ms": round(_percentile(v, 0.95), 2),
+        "p99_ms": round(_percentile(v, 0.99), 2),
+        "max_ms": round(v[-1], 2) if v else 0.0,
+    }
+
+def summarize(samples):
+    """samples: [(event type, latency ms)] -> per-type latency stats and frame-budget overruns."""
+    by_type = {}
+    for kind, ms in samples:
+        by_type.setdefault(kind, []).append(ms)
+    all_ms = [ms for _, ms in samples]
+    return {
+        "frame_budget_ms": round(FRAME_BUDGET_MS, 2),
+        "all": _stats(all_ms),
+        "by_type": {k: _stats(v) for k, v in sorted(by_type.items())},
+        "over_budget": sum(1 for ms in all_ms if ms > FRAME_BUDGET_MS),
+        "dropped_frames": sum(math.ceil(ms / FRAME_BUDGET_MS) - 1 for ms in all_ms if ms > FRAME_BUDGET_MS),
+    }
+
+def format_report(report) -> str:
+    rows = [("all", report["all"])] + list(report["by_type"].items())
+    lines = [f"{'event':<10}{'n':>7}{'mean':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)"]
+    for name, s in rows:
+        lines.append(f"{name:<10}{s['n']:>7}{s['mean_ms']:>9.2f}{s['p50_ms']:>9.2f}"
+                     f"{s['p95_ms']:>9.2f}{s['p99_ms']:>9.2f}{s['max_ms']:>9.2f}")
+    lines.append(f"Over the {report['frame_budget_ms']} ms budget: {report['over_budget']} event(s), "
+                 f"{report['dropped_frames']} dropped frame(s)")
+    if report.get("late_events") is not None:
+        lines.append(f"Started late (backlog): {report['late_events']} event(s); wall time {report['wall_s']} s")
+    return "\n".join(lines)
+
+def replay_file(path: str, image_path: str = None, realtime: bool = True, speed: float = 1.0, bake_dim: bool = True):
+    """Replay a trace in a bare Tk window holding only the viewport. Needs a display (Xvfb works)."""
+    import tkinter as tk
+    from viewport import ImageViewport
+
+    header, events = load_trace(path)
+    image = Image.open(image_path).convert("RGB") if image_path else None
+    root = tk.Tk()
+    root.title("Viewport trace replay")
+    try:
+        viewport = ImageViewport(root, lambda: replayer.frame_size, bake_dim=bake_dim)
+        viewport.pack(fill="both", expand=True)
+        replayer = TraceReplayer(root, viewport, int(header.get("frame_size") or 768), image)
+        root.update()
+        return replayer.run(events, realtime=realtime, speed=speed)
+    finally:
+        root.destroy()